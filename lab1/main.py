@@ -1,4 +1,19 @@
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
 import random
+import sys
+from collections import deque
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lfa_common.compiled import CompiledAutomaton, StreamMatcher, parallel_match
+from lfa_common.tracked import TrackedDict, TrackedSet
+
+class _ProductionMap(TrackedDict):
+    def _element(self, rhs):
+        return tuple(rhs) if isinstance(rhs, list) else rhs
 
 class Grammar:
     def __init__(self):
@@ -10,34 +25,272 @@ class Grammar:
             "B": ["aB", "bB", "c"]
         }
         self.start_symbol = "S"
+        self.weights = {}
+    
+    @property
+    def VN(self):
+        return self._VN
+    
+    @VN.setter
+    def VN(self, nonterminals):
+        self._VN = TrackedSet(nonterminals)
+        self._reset_caches()
+    
+    @property
+    def VT(self):
+        return self._VT
+    
+    @VT.setter
+    def VT(self, terminals):
+        self._VT = TrackedSet(terminals)
+        self._reset_caches()
+    
+    @property
+    def P(self):
+        return self._P
+    
+    @P.setter
+    def P(self, productions):
+        self._P = _ProductionMap(productions)
+        self._reset_caches()
+    
+    @property
+    def weights(self):
+        return self._weights
+    
+    @weights.setter
+    def weights(self, weights):
+        self._weights = TrackedDict(weights)
+        self._reset_caches()
+    
+    @property
+    def start_symbol(self):
+        return self._start_symbol
+    
+    @start_symbol.setter
+    def start_symbol(self, start_symbol):
+        self._start_symbol = start_symbol
+        self._reset_caches()
+    
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.update(_production_table=None, _length_counts=None,
+                     _automaton=None, _compiled=None, _cache_key=None)
+        return state
+    
+    def _reset_caches(self):
+        self._production_table = None
+        self._length_counts = None
+        self._automaton = None
+        self._compiled = None
+        self._cache_key = None
+    
+    def _check_caches(self):
+        key = (self._VN.version, self._VT.version, self._P.version, self._weights.version)
+        if key != self._cache_key:
+            self._reset_caches()
+            self._cache_key = key
+    
+    def fingerprint(self):
+        content = [sorted(self.VN), sorted(self.VT), self.start_symbol, {nt: list(rhs) for nt, rhs in self.P.items()}]
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+    
+    def compile(self, cache_dir=None):
+        self._check_caches()
+        if cache_dir is not None:
+            path = os.path.join(cache_dir, f"{self.fingerprint()}.dfa")
+            self._compiled = CompiledAutomaton.load_or_build(
+                path, lambda: self.to_finite_automaton().compile(), self._compiled)
+        elif self._compiled is None:
+            self._compiled = self.to_finite_automaton().compile()
+        return self._compiled
+    
+    def production_table(self):
+        self._check_caches()
+        if self._production_table is None:
+            table = {}
+            for nt, rhs_list in self.P.items():
+                weights = self.weights.get(nt, [1] * len(rhs_list))
+                table[nt] = ([tuple(rhs) for rhs in rhs_list], list(itertools.accumulate(weights)))
+            self._production_table = table
+        return self._production_table
+    
+    def generate_string(self, max_length=None, max_attempts=1000, rng=random):
+        return self._generate(self.production_table(), max_length, max_attempts, rng)
+    
+    def _generate(self, table, max_length=None, max_attempts=1000, rng=random):
+        for _ in range(max_attempts):
+            result = self._derive(table, max_length, rng)
+            if result is not None:
+                return result
+        raise ValueError(f"No derivation within max_length={max_length} after {max_attempts} attempts")
+    
+    def _derive(self, table, max_length, rng):
+        choices = rng.choices
+        output = []
+        stack = [self.start_symbol]
+        while stack:
+            sym = stack.pop()
+            productions = table.get(sym)
+            if productions is None:
+                output.append(sym)
+                if max_length is not None and len(output) > max_length:
+                    return None
+            else:
+                rhs_list, cum_weights = productions
+                stack.extend(reversed(choices(rhs_list, cum_weights=cum_weights)[0]))
+        return "".join(output)
+    
+    def generate_strings(self, count=5, max_length=None):
+        table = self.production_table()
+        return [self._generate(table, max_length) for _ in range(count)]
+    
+    def sample_strings(self, count, seed=None, workers=1, chunksize=1000, max_length=None, rng=None):
+        if rng is not None:
+            table = self.production_table()
+            for _ in range(count):
+                yield self._generate(table, max_length, rng=rng)
+            return
+        
+        if seed is None:
+            seed = random.randrange(2 ** 63)
+        tasks = (
+            (seed, index, min(chunksize, count - start), max_length)
+            for index, start in enumerate(range(0, count, chunksize))
+        )
+        if workers == 1:
+            for task in tasks:
+                yield from self._sample_chunk(task)
+            return
+        
+        with multiprocessing.Pool(workers, _init_sample_worker, (self,)) as pool:
+            pending = deque()
+            for task in tasks:
+                pending.append(pool.apply_async(_sample_worker_chunk, (task,)))
+                if len(pending) >= workers * 2:
+                    yield from pending.popleft().get()
+            while pending:
+                yield from pending.popleft().get()
     
-    def generate_string(self):
-        result = self.start_symbol
-        while any(sym in self.VN for sym in result):
-            for sym in self.VN:
-                if sym in result:
-                    replacement = random.choice(self.P[sym])
-                    result = result.replace(sym, replacement, 1)
-        return result
+    def _sample_chunk(self, task):
+        seed, index, size, max_length = task
+        rng = random.Random(f"{seed}:{index}")
+        table = self.production_table()
+        return [self._generate(table, max_length, rng=rng) for _ in range(size)]
     
-    def generate_strings(self, count=5):
-        return [self.generate_string() for _ in range(count)]
+    def _extend_counts(self, length):
+        fa = self.to_finite_automaton()
+        if self._length_counts is None:
+            moves = {state: [] for state in fa.Q}
+            for (state, symbol), next_state in sorted(fa.delta.items(), key=lambda item: item[0][1]):
+                moves[state].append((symbol, next_state))
+            self._length_counts = (moves, [{state: int(state in fa.F) for state in moves}])
+        moves, counts = self._length_counts
+        while len(counts) <= length:
+            shorter = counts[-1]
+            counts.append({state: sum(shorter[next_state] for _, next_state in edges)
+                           for state, edges in moves.items()})
+        return fa, moves, counts
+    
+    def count_strings(self, length):
+        fa, _, counts = self._extend_counts(length)
+        return counts[length][fa.q0]
+    
+    def sample_uniform(self, length, rng=random):
+        fa, moves, counts = self._extend_counts(length)
+        if not counts[length][fa.q0]:
+            raise ValueError(f"The grammar derives no strings of length {length}")
+        output = []
+        state = fa.q0
+        for n in range(length - 1, -1, -1):
+            r = rng.randrange(counts[n + 1][state])
+            for symbol, next_state in moves[state]:
+                c = counts[n][next_state]
+                if r < c:
+                    output.append(symbol)
+                    state = next_state
+                    break
+                r -= c
+        return "".join(output)
     
     def to_finite_automaton(self):
-        Q = {"S", "A", "B", "Final"} 
-        Sigma = self.VT  
-        delta = {
-            ("S", "a"): "S",
-            ("S", "b"): "S",
-            ("S", "c"): "A",
-            ("A", "a"): "B",
-            ("B", "a"): "B",
-            ("B", "b"): "B",
-            ("B", "c"): "Final",
-        }
-        q0 = "S" 
-        F = {"Final"} 
-        return FiniteAutomaton(Q, Sigma, delta, q0, F)
+        self._check_caches()
+        if self._automaton is None:
+            transitions, final = self._build_nfa()
+            Q, delta, q0, F = _subset_construction(transitions, self.start_symbol, {final})
+            self._automaton = FiniteAutomaton(Q, set(self.VT), delta, q0, F)
+        return self._automaton
+    
+    def _build_nfa(self):
+        final = "Final"
+        while final in self.VN:
+            final += "'"
+        transitions = {}
+        
+        def add(state, symbol, next_state):
+            transitions.setdefault(state, {}).setdefault(symbol, set()).add(next_state)
+        
+        for nt, rhs_list in self.P.items():
+            for index, rhs in enumerate(rhs_list):
+                if rhs and rhs[-1] in self.VN:
+                    prefix, target = rhs[:-1], rhs[-1]
+                else:
+                    prefix, target = rhs, final
+                if any(sym in self.VN for sym in prefix):
+                    raise ValueError(f"Production {nt} -> {rhs} is not right-linear")
+                if not prefix:
+                    add(nt, "", target)
+                    continue
+                state = nt
+                for position, sym in enumerate(prefix[:-1]):
+                    next_state = (nt, index, position)
+                    add(state, sym, next_state)
+                    state = next_state
+                add(state, prefix[-1], target)
+        return transitions, final
+
+def _subset_construction(transitions, start, finals):
+    closures = {}
+    
+    def closure(state):
+        if state not in closures:
+            reached = {state}
+            stack = [state]
+            while stack:
+                for next_state in transitions.get(stack.pop(), {}).get("", ()):
+                    if next_state not in reached:
+                        reached.add(next_state)
+                        stack.append(next_state)
+            closures[state] = frozenset(reached)
+        return closures[state]
+    
+    start_set = closure(start)
+    subsets = [start_set]
+    seen = {start_set}
+    delta = {}
+    queue = deque([start_set])
+    while queue:
+        current = queue.popleft()
+        moves = {}
+        for state in current:
+            for symbol, next_states in transitions.get(state, {}).items():
+                if symbol:
+                    for next_state in next_states:
+                        moves.setdefault(symbol, set()).update(closure(next_state))
+        for symbol, next_states in moves.items():
+            next_set = frozenset(next_states)
+            if next_set not in seen:
+                seen.add(next_set)
+                subsets.append(next_set)
+                queue.append(next_set)
+            delta[(current, symbol)] = next_set
+    
+    F = {subset for subset in subsets if not finals.isdisjoint(subset)}
+    if all(len(subset) == 1 for subset in subsets):
+        name = {subset: next(iter(subset)) for subset in subsets}
+        delta = {(name[state], symbol): name[next_state] for (state, symbol), next_state in delta.items()}
+        return set(name.values()), delta, name[start_set], {name[subset] for subset in F}
+    return set(subsets), delta, start_set, F
 
 class FiniteAutomaton:
     def __init__(self, Q, Sigma, delta, q0, F):
@@ -47,14 +300,65 @@ class FiniteAutomaton:
         self.q0 = q0
         self.F = F
     
+    @property
+    def delta(self):
+        return self._delta
+    
+    @delta.setter
+    def delta(self, delta):
+        self._delta = TrackedDict(delta)
+        self._compiled = None
+    
+    @property
+    def F(self):
+        return self._F
+    
+    @F.setter
+    def F(self, F):
+        self._F = TrackedSet(F)
+        self._compiled = None
+    
+    @property
+    def q0(self):
+        return self._q0
+    
+    @q0.setter
+    def q0(self, q0):
+        self._q0 = q0
+        self._compiled = None
+    
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_compiled"] = None
+        return state
+    
+    def compile(self):
+        key = (self._delta.version, self._F.version)
+        if self._compiled is None or self._compiled_key != key:
+            self._compiled = CompiledAutomaton(self.Q, self.Sigma, self.delta, self.q0, self.F)
+            self._compiled_key = key
+        return self._compiled
+    
     def string_belongs(self, input_string):
-        state = self.q0
-        for char in input_string:
-            if (state, char) in self.delta:
-                state = self.delta[(state, char)]
-            else:
-                return False
-        return state in self.F
+        return self.compile().matches(input_string)
+    
+    def match_many(self, strings):
+        return self.compile().match_many(strings)
+    
+    def matcher(self, encoding="utf-8"):
+        return StreamMatcher(self.compile(), encoding)
+    
+    def parallel_match(self, strings, workers=None, chunksize=1024, stats=None):
+        return parallel_match(self.compile(), strings, workers, chunksize, stats)
+
+_worker_grammar = None
+
+def _init_sample_worker(grammar):
+    global _worker_grammar
+    _worker_grammar = grammar
+
+def _sample_worker_chunk(task):
+    return _worker_grammar._sample_chunk(task)
 
 if __name__ == "__main__":
     grammar = Grammar()
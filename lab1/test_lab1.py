@@ -0,0 +1,254 @@
+import io
+import pickle
+import random
+import os
+import tempfile
+import unittest
+from main import Grammar, FiniteAutomaton
+
+
+class TestGrammar(unittest.TestCase):
+
+    def setUp(self):
+        self.grammar = Grammar()
+        self.fa = self.grammar.to_finite_automaton()
+
+    def test_generated_strings_belong(self):
+        strings = self.grammar.generate_strings(200)
+        self.assertTrue(all(self.fa.match_many(strings)))
+
+    def test_max_length(self):
+        strings = self.grammar.generate_strings(100, max_length=5)
+        self.assertTrue(all(len(s) <= 5 for s in strings))
+        self.assertTrue(all(self.fa.match_many(strings)))
+        with self.assertRaises(ValueError):
+            self.grammar.generate_string(max_length=2, max_attempts=10)
+
+    def test_weights(self):
+        self.grammar.weights = {"S": [0, 0, 1], "B": [0, 0, 1]}
+        self.assertEqual(self.grammar.generate_strings(3), ["cac", "cac", "cac"])
+
+    def test_sample_strings_reproducible(self):
+        first = list(self.grammar.sample_strings(50, seed=7, chunksize=8))
+        self.assertEqual(first, list(self.grammar.sample_strings(50, seed=7, chunksize=8)))
+        self.assertEqual(first, list(self.grammar.sample_strings(50, seed=7, workers=2, chunksize=8)))
+        self.assertTrue(all(self.fa.match_many(first)))
+
+    def test_sample_strings_with_rng(self):
+        first = list(self.grammar.sample_strings(10, rng=random.Random(3)))
+        self.assertEqual(first, list(self.grammar.sample_strings(10, rng=random.Random(3))))
+
+    def test_count_strings(self):
+        self.assertEqual([self.grammar.count_strings(n) for n in range(6)], [0, 0, 0, 1, 4, 12])
+
+    def test_sample_uniform(self):
+        rng = random.Random(11)
+        samples = [self.grammar.sample_uniform(6, rng) for _ in range(3000)]
+        self.assertTrue(all(len(s) == 6 for s in samples))
+        self.assertTrue(all(self.fa.match_many(samples)))
+        self.assertEqual(len(set(samples)), self.grammar.count_strings(6))
+        with self.assertRaises(ValueError):
+            self.grammar.sample_uniform(2)
+
+    def test_sample_uniform_over_strings(self):
+        self.grammar.VN = {"S", "A"}
+        self.grammar.P = {"S": ["aS", "aA", "b"], "A": ["b", "c"]}
+        self.assertEqual(self.grammar.count_strings(2), 2)
+        rng = random.Random(5)
+        samples = [self.grammar.sample_uniform(2, rng) for _ in range(4000)]
+        self.assertEqual(set(samples), {"ab", "ac"})
+        self.assertLess(abs(samples.count("ab") - 2000), 200)
+
+    def test_sample_uniform_list_productions(self):
+        self.grammar.P = {"S": [["a", "S"], ["c", "A"]], "A": [["a", "B"]], "B": [["b", "B"], ["c"]]}
+        self.assertEqual(self.grammar.count_strings(5), 3)
+        samples = {self.grammar.sample_uniform(5, random.Random(seed)) for seed in range(50)}
+        self.assertEqual(samples, {"aacac", "acabc", "cabbc"})
+
+    def test_to_finite_automaton_derives_delta(self):
+        self.assertEqual(self.fa.Q, {"S", "A", "B", "Final"})
+        self.assertEqual(self.fa.delta[("S", "c")], "A")
+        self.assertEqual(self.fa.delta[("B", "c")], "Final")
+        self.assertEqual(self.fa.F, {"Final"})
+
+    def test_to_finite_automaton_nondeterministic_grammar(self):
+        self.grammar.VN = {"S", "A"}
+        self.grammar.P = {"S": ["abS", "ab", "A"], "A": ["cA", ""]}
+        fa = self.grammar.to_finite_automaton()
+        self.assertIsNot(fa, self.fa)
+        self.assertEqual(fa.match_many(["", "ab", "ababcc", "abx", "ca", "a"]), [True, True, True, False, False, False])
+
+    def test_to_finite_automaton_is_cached(self):
+        self.assertIs(self.grammar.to_finite_automaton(), self.fa)
+        self.grammar.P = dict(self.grammar.P, B=["c"])
+        self.assertIsNot(self.grammar.to_finite_automaton(), self.fa)
+
+    def test_caches_follow_in_place_edits(self):
+        self.assertFalse(self.grammar.compile().matches("caa"))
+        self.grammar.P["B"].append("a")
+        self.assertTrue(self.grammar.compile().matches("caa"))
+        self.assertTrue(self.grammar.to_finite_automaton().string_belongs("caa"))
+        self.assertEqual(self.grammar.count_strings(3), 2)
+        self.grammar.weights["S"] = [0, 0, 1]
+        self.grammar.weights["B"] = [0, 0, 0, 1]
+        self.assertEqual(self.grammar.generate_strings(2), ["caa", "caa"])
+
+    def test_single_samples_follow_edits(self):
+        self.grammar.generate_string()
+        self.grammar.P = {"S": ["x"]}
+        self.grammar.VN = {"S"}
+        self.assertEqual(self.grammar.generate_string(), "x")
+
+        grammar = Grammar()
+        self.assertEqual(grammar.sample_uniform(3), "cac")
+        grammar.P["B"] = ["d"]
+        self.assertEqual(grammar.sample_uniform(3), "cad")
+        grammar.weights = {"S": [1, 0, 0]}
+        grammar.weights["S"][2] = 1
+        grammar.weights["S"][0] = 0
+        self.assertEqual(grammar.generate_string(), "cad")
+
+    def test_list_productions_are_frozen(self):
+        self.grammar.P = {"S": [["a", "S"], ["b"]]}
+        self.grammar.VN = {"S"}
+        self.assertFalse(self.grammar.to_finite_automaton().string_belongs("ac"))
+        with self.assertRaises(TypeError):
+            self.grammar.P["S"][1][0] = "c"
+        self.grammar.P["S"][1] = ["c"]
+        self.grammar.P["S"].append(["d"])
+        self.assertEqual(self.grammar.P["S"], [("a", "S"), ("c",), ("d",)])
+        self.assertTrue(self.grammar.to_finite_automaton().string_belongs("ac"))
+        self.assertFalse(self.grammar.to_finite_automaton().string_belongs("ab"))
+
+    def test_reassigned_productions_are_copied(self):
+        productions = {"S": ["a"]}
+        self.grammar.P = productions
+        self.grammar.VN = {"S"}
+        productions["S"] = ["b"]
+        self.assertEqual(self.grammar.generate_string(), "a")
+        self.assertEqual(pickle.loads(pickle.dumps(self.grammar)).generate_string(), "a")
+
+    def test_compile_cache_roundtrip(self):
+        strings = self.grammar.generate_strings(100) + ["", "cac", "cab", "abc"]
+        with tempfile.TemporaryDirectory() as cache_dir:
+            built = self.grammar.compile(cache_dir)
+            path = os.path.join(cache_dir, self.grammar.fingerprint() + ".dfa")
+            self.assertTrue(os.path.exists(path))
+            loaded = Grammar().compile(cache_dir)
+            self.assertIsInstance(loaded.table, memoryview)
+            self.assertEqual(loaded.match_many(strings), built.match_many(strings))
+            self.assertEqual(list(loaded.match_batch(loaded.encode_batch(strings))), built.match_many(strings))
+            self.assertEqual(pickle.loads(pickle.dumps(loaded)).match_many(strings), built.match_many(strings))
+
+            with open(path, "wb") as f:
+                f.write(b"stale")
+            rebuilt = Grammar().compile(cache_dir)
+            self.assertEqual(rebuilt.match_many(strings), built.match_many(strings))
+            self.assertIsInstance(Grammar().compile(cache_dir).table, memoryview)
+
+    def test_compile_cache_saves_existing_table(self):
+        compiled = self.grammar.compile()
+        with tempfile.TemporaryDirectory() as cache_dir:
+            self.assertIs(self.grammar.compile(cache_dir), compiled)
+            path = os.path.join(cache_dir, self.grammar.fingerprint() + ".dfa")
+            self.assertTrue(os.path.exists(path))
+            self.assertEqual(Grammar().compile(cache_dir).match_many(["cac", "ca"]), [True, False])
+
+
+class TestFiniteAutomaton(unittest.TestCase):
+
+    def setUp(self):
+        self.fa = Grammar().to_finite_automaton()
+
+    def test_string_belongs(self):
+        self.assertTrue(self.fa.string_belongs("cac"))
+        self.assertTrue(self.fa.string_belongs("abcabac"))
+        self.assertFalse(self.fa.string_belongs("ca"))
+        self.assertFalse(self.fa.string_belongs("cacx"))
+        self.assertFalse(self.fa.string_belongs(""))
+
+    def test_match_many(self):
+        strings = ["cac", "ccc", "bcaac", "bac", "xyz"]
+        self.assertEqual(self.fa.match_many(strings), [True, False, True, False, False])
+        self.assertEqual(self.fa.match_many(strings), [self.fa.string_belongs(s) for s in strings])
+
+    def test_compile_is_cached(self):
+        self.assertIs(self.fa.compile(), self.fa.compile())
+
+    def test_compile_follows_edits(self):
+        fa = FiniteAutomaton({"q0", "q1"}, {"a"}, {("q0", "a"): "q1"}, "q0", {"q1"})
+        self.assertFalse(fa.string_belongs("aa"))
+        fa.delta[("q1", "a")] = "q1"
+        fa.F.add("q0")
+        self.assertTrue(fa.string_belongs("aa"))
+        self.assertTrue(fa.string_belongs(""))
+        fa.F = {"q1"}
+        self.assertFalse(fa.string_belongs(""))
+        copy = pickle.loads(pickle.dumps(fa))
+        self.assertTrue(copy.string_belongs("aa"))
+        copy.F.add("q0")
+        self.assertTrue(copy.string_belongs(""))
+
+    def test_constructor_copies_delta(self):
+        delta = {("q0", "a"): "q0"}
+        fa = FiniteAutomaton({"q0"}, {"a", "b"}, delta, "q0", {"q0"})
+        delta[("q0", "b")] = "q0"
+        self.assertFalse(fa.string_belongs("b"))
+        self.assertIsNot(fa.delta, delta)
+        fa.delta[("q0", "b")] = "q0"
+        self.assertTrue(fa.string_belongs("b"))
+
+    def test_accepting_start_state(self):
+        fa = FiniteAutomaton({"q"}, {"a"}, {("q", "a"): "q"}, "q", {"q"})
+        self.assertTrue(fa.string_belongs(""))
+        self.assertTrue(fa.string_belongs("aaa"))
+        self.assertEqual(fa.match_many(["", "ab"]), [True, False])
+
+    def test_match_batch(self):
+        compiled = self.fa.compile()
+        strings = ["cac", "ccc", "bcaac", "", "bac", "cacx", "abcabac"]
+        expected = compiled.match_many(strings)
+        self.assertEqual(list(compiled.match_batch(compiled.encode_batch(strings))), expected)
+        codes, offsets = compiled.encode_batch(strings, padded=False)
+        self.assertEqual(list(compiled.match_batch(codes, offsets)), expected)
+
+    def test_stream_matcher_feed(self):
+        matcher = self.fa.matcher()
+        matcher.feed("ab")
+        matcher.feed(b"ca")
+        self.assertFalse(matcher.accepts())
+        matcher.feed("c")
+        self.assertTrue(matcher.accepts())
+        matcher.reset()
+        self.assertFalse(matcher.accepts())
+
+    def test_match_records_from_file(self):
+        records = ["cac", "ccc", "abcabac", "", "bac"]
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, "wb") as f:
+            f.write("\n".join(records).encode())
+        try:
+            matcher = self.fa.matcher()
+            expected = [True, False, True, False, False]
+            self.assertEqual(list(matcher.match_records(path, chunk_size=2)), expected)
+            self.assertEqual(list(matcher.match_records(path, chunk_size=3, use_mmap=True)), expected)
+        finally:
+            os.remove(path)
+
+    def test_match_records_multichar_delimiter(self):
+        source = io.StringIO("cac\r\nccc\r\nbcaac\r\n")
+        results = self.fa.matcher().match_records(source, delimiter="\r\n", chunk_size=4)
+        self.assertEqual(list(results), [True, False, True])
+
+    def test_parallel_match(self):
+        strings = ["cac", "ccc", "bcaac", "", "bac", "abcabac"] * 50
+        stats = {}
+        results = list(self.fa.parallel_match(iter(strings), workers=2, chunksize=7, stats=stats))
+        self.assertEqual(results, self.fa.match_many(strings))
+        self.assertEqual(stats["strings"], len(strings))
+        self.assertEqual(stats["chunks"], (len(strings) + 6) // 7)
+        self.assertGreater(stats["strings_per_second"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
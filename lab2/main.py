@@ -1,3 +1,26 @@
+import hashlib
+import itertools
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lfa_common.compiled import CompiledAutomaton, parallel_match
+from lfa_common.interned import TERMINAL, NONTERMINAL, SymbolTable, InternedGrammar
+from lfa_common.tracked import TrackedDict, TrackedSet
+
+EPSILON = ''
+
+CHOMSKY_TYPES = {
+    3: "Type 3: Regular Grammar",
+    2: "Type 2: Context-Free Grammar",
+    1: "Type 1: Context-Sensitive Grammar",
+    0: "Type 0: Unrestricted Grammar",
+}
+
+
 class Grammar:
     def __init__(self, Vn, Vt, P, S):
         self.Vn = Vn
@@ -5,36 +28,110 @@ class Grammar:
         self.P = P
         self.S = S
 
-    def classify_chomsky(self):
+    def symbol_table(self):
+        table = SymbolTable()
+        for symbol in sorted(self.Vt, key=str):
+            table.intern(symbol, TERMINAL)
+        for symbol in sorted(self.Vn, key=str):
+            table.intern(symbol, NONTERMINAL)
+        return table
+
+    def to_interned(self):
+        interned = InternedGrammar(self.symbol_table())
+        interned.start = interned.symbols.tokenize(self.S)
+        for lhs, rhs_list in self.P.items():
+            lhs_tokens = interned.symbols.tokenize(lhs)
+            interned.productions.setdefault(lhs_tokens, {})
+            for rhs in rhs_list:
+                interned.add(lhs_tokens, interned.symbols.tokenize(rhs))
+        return interned
+
+    @classmethod
+    def from_interned(cls, interned):
+        symbols = interned.symbols.symbols
+        kinds = interned.symbols.kinds
+        Vn = {symbol for symbol, kind in zip(symbols, kinds) if kind == NONTERMINAL}
+        Vt = {symbol for symbol, kind in zip(symbols, kinds) if kind == TERMINAL}
+        P = {}
+        for lhs, rhs_set in interned.productions.items():
+            P[''.join(symbols[token] for token in lhs)] = [''.join(symbols[token] for token in rhs) for rhs in rhs_set]
+        S = ''.join(symbols[token] for token in interned.start)
+        return cls(Vn, Vt, P, S)
+
+    def classify(self):
+        table = self.symbol_table()
+        kinds = table.kinds
+        start = table.tokenize(self.S)
         is_type_3 = True
         is_type_2 = True
         is_type_1 = True
+        diagnostics = []
 
         for lhs, rhs_list in self.P.items():
+            lhs_tokens = table.tokenize(lhs)
+            single_nonterminal = len(lhs_tokens) == 1 and kinds[lhs_tokens[0]] == NONTERMINAL
             for rhs in rhs_list:
-                if is_type_3:
-                    right_linear = (len(rhs) <= 1 or 
-                                   (len(rhs) == 2 and rhs[0] in self.Vt and rhs[1] in self.Vn))
-                    left_linear = (len(rhs) <= 1 or 
-                                  (len(rhs) == 2 and rhs[0] in self.Vn and rhs[1] in self.Vt))
-                    if not (right_linear or left_linear):
-                        is_type_3 = False
-
-                if is_type_2 and (len(lhs) != 1 or lhs not in self.Vn):
-                    is_type_2 = False
-
-                if is_type_1:
-                    if len(lhs) > len(rhs) and not (lhs == self.S and rhs == ''):
-                        is_type_1 = False
-
-        if is_type_3:
-            return "Type 3: Regular Grammar"
-        elif is_type_2:
-            return "Type 2: Context-Free Grammar"
-        elif is_type_1:
-            return "Type 1: Context-Sensitive Grammar"
+                rhs_tokens = table.tokenize(rhs)
+                rhs_kinds = bytes(kinds[token] for token in rhs_tokens)
+
+                regular = single_nonterminal and (
+                    len(rhs_tokens) <= 1 or
+                    rhs_kinds in (bytes([TERMINAL, NONTERMINAL]), bytes([NONTERMINAL, TERMINAL]))
+                )
+                context_free = single_nonterminal
+                context_sensitive = len(lhs_tokens) <= len(rhs_tokens) or (lhs_tokens == start and not rhs_tokens)
+
+                production_type = 3 if regular else 2 if context_free else 1 if context_sensitive else 0
+                diagnostics.append({
+                    "lhs": lhs,
+                    "rhs": rhs,
+                    "tokens": [table.symbols[token] for token in rhs_tokens],
+                    "type": production_type,
+                })
+
+                is_type_3 = is_type_3 and regular
+                is_type_2 = is_type_2 and context_free
+                is_type_1 = is_type_1 and context_sensitive
+                if not (is_type_3 or is_type_2 or is_type_1):
+                    return 0, diagnostics
+
+        grammar_type = 3 if is_type_3 else 2 if is_type_2 else 1
+        return grammar_type, diagnostics
+
+    def classify_chomsky(self):
+        grammar_type, _ = self.classify()
+        return CHOMSKY_TYPES[grammar_type]
+
+
+class _TransitionMap(TrackedDict):
+    def __init__(self, transitions=()):
+        self.index = {}
+        super().__init__(transitions)
+
+    def _changed(self, key=None):
+        super()._changed(key)
+        if key is None:
+            self.index.clear()
+            for key in self:
+                self._reindex(key)
+        else:
+            self._reindex(key)
+
+    def _extended(self, key, values):
+        super()._changed(key)
+        state, symbol = key
+        self.index.setdefault(state, {}).setdefault(symbol, set()).update(values)
+
+    def _reindex(self, key):
+        state, symbol = key
+        symbol_map = self.index.setdefault(state, {})
+        if key in self:
+            next_states = dict.__getitem__(self, key)
+            symbol_map[symbol] = set(next_states) if isinstance(next_states, list) else {next_states}
         else:
-            return "Type 0: Unrestricted Grammar"
+            symbol_map.pop(symbol, None)
+            if not symbol_map:
+                del self.index[state]
 
 
 class FiniteAutomaton:
@@ -45,134 +142,460 @@ class FiniteAutomaton:
         self.start_state = start_state
         self.final_states = final_states
 
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.update(_closures=None, _compiled=None)
+        return state
+
+    @property
+    def transitions(self):
+        return self._transitions
+
+    @transitions.setter
+    def transitions(self, transitions):
+        self._transitions = _TransitionMap(transitions)
+        self._closures = None
+        self._compiled = None
+
+    @property
+    def start_state(self):
+        return self._start_state
+
+    @start_state.setter
+    def start_state(self, start_state):
+        self._start_state = start_state
+        self._compiled = None
+
+    @property
+    def final_states(self):
+        return self._final_states
+
+    @final_states.setter
+    def final_states(self, final_states):
+        self._final_states = TrackedSet(final_states)
+        self._compiled = None
+
+    @property
+    def _index(self):
+        return self._transitions.index
+
+    def add_transition(self, state, symbol, next_state):
+        key = (state, symbol)
+        if key not in self.transitions:
+            self.transitions[key] = next_state
+            return
+        current = self.transitions[key]
+        if isinstance(current, list):
+            if next_state not in self._index[state][symbol]:
+                current.append(next_state)
+        elif current != next_state:
+            self.transitions[key] = [current, next_state]
+
     def is_deterministic(self):
-        defined_transitions = {}
-        
-        for (state, symbol), next_states in self.transitions.items():
-            key = (state, symbol)
-            
-            if key in defined_transitions:
-                return False
-            defined_transitions[key] = True
-            
-            if isinstance(next_states, list) and len(next_states) > 1:
+        for symbol_map in self._index.values():
+            if EPSILON in symbol_map:
                 return False
-                
+            for next_states in symbol_map.values():
+                if len(next_states) > 1:
+                    return False
         return True
 
     def get_next_states(self, state, symbol):
-        next_states = []
-        for (s, sym), next_state in self.transitions.items():
-            if s == state and sym == symbol:
-                if isinstance(next_state, list):
-                    next_states.extend(next_state)
-                else:
-                    next_states.append(next_state)
-        return next_states
+        return list(self._index.get(state, {}).get(symbol, ()))
+
+    def epsilon_closure(self, state):
+        if self._closures is None or self._closures_version != self._transitions.version:
+            self._compute_epsilon_closures()
+        closure = self._closures.get(state)
+        if closure is None:
+            closure = self._closures[state] = frozenset([state])
+        return closure
+
+    def _compute_epsilon_closures(self):
+        graph = {state: symbol_map[EPSILON] for state, symbol_map in self._index.items() if EPSILON in symbol_map}
+        order = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+        closures = {}
+
+        for root in graph:
+            if root in order:
+                continue
+            order[root] = lowlink[root] = len(order)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(graph[root]))]
+
+            while work:
+                state, successors = work[-1]
+                descended = False
+                for next_state in successors:
+                    if next_state not in order:
+                        order[next_state] = lowlink[next_state] = len(order)
+                        stack.append(next_state)
+                        on_stack.add(next_state)
+                        work.append((next_state, iter(graph.get(next_state, ()))))
+                        descended = True
+                        break
+                    if next_state in on_stack:
+                        lowlink[state] = min(lowlink[state], order[next_state])
+                if descended:
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[state])
+
+                if lowlink[state] == order[state]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == state:
+                            break
+
+                    reachable = set(component)
+                    for member in component:
+                        for next_state in graph.get(member, ()):
+                            if next_state not in reachable:
+                                reachable.update(closures[next_state])
+
+                    closure = frozenset(reachable)
+                    for member in component:
+                        closures[member] = closure
+
+        self._closures = closures
+        self._closures_version = self._transitions.version
 
     def to_regular_grammar(self):
-        Vn = self.states
+        Vn = {str(state) for state in self.states}
         Vt = self.alphabet
-        S = self.start_state
+        S = str(self.start_state)
         
         P = {}
         for state in self.states:
-            P[state] = []
+            P[str(state)] = []
             
-        for (state, symbol), next_state in self.transitions.items():
-            if isinstance(next_state, list):
-                for ns in next_state:
+        for state, symbol_map in self._index.items():
+            for symbol, next_states in symbol_map.items():
+                for ns in next_states:
                     if ns in self.final_states:
-                        P[state].append(symbol)
-                    P[state].append(symbol + ns)
-            else:
-                if next_state in self.final_states:
-                    P[state].append(symbol)
-                P[state].append(symbol + next_state)
+                        P[str(state)].append(symbol)
+                    P[str(state)].append(symbol + str(ns))
         
         for final_state in self.final_states:
-            if final_state in P:
-                P[final_state].append('')
+            if str(final_state) in P:
+                P[str(final_state)].append('')
             else:
-                P[final_state] = ['']
+                P[str(final_state)] = ['']
                 
         return Grammar(Vn, Vt, P, S)
 
-    def to_dfa(self):
+    # with_subsets=True also returns a dict from each DFA state to the set of
+    # original states it stands for. Deterministic input is returned as is,
+    # keeping its state names; otherwise the DFA states are numbered from 0.
+    def to_dfa(self, with_subsets=False):
         if self.is_deterministic():
+            if with_subsets:
+                return self, {state: frozenset([state]) for state in self.states}
             return self
-            
-        new_states = []
+
+        final_states = set(self.final_states)
+        initial_state_set = self.epsilon_closure(self.start_state)
+        subset_ids = {initial_state_set: 0}
+        subsets = [initial_state_set]
         new_transitions = {}
-        new_final_states = []
-        
-        initial_state_set = frozenset([self.start_state])
-        states_queue = [initial_state_set]
-        new_states.append(initial_state_set)
-        
+        new_final_states = set()
+
+        states_queue = deque([initial_state_set])
         while states_queue:
-            current_state_set = states_queue.pop(0)
-            
-            if any(state in self.final_states for state in current_state_set):
-                new_final_states.append(current_state_set)
-            
-            for symbol in self.alphabet:
+            current_state_set = states_queue.popleft()
+            current_id = subset_ids[current_state_set]
+
+            if not final_states.isdisjoint(current_state_set):
+                new_final_states.add(current_id)
+
+            moves = {}
+            for state in current_state_set:
+                for symbol, next_states in self._index.get(state, {}).items():
+                    if symbol != EPSILON:
+                        moves.setdefault(symbol, set()).update(next_states)
+
+            for symbol in sorted(moves):
                 next_state_set = set()
-                
-                for state in current_state_set:
-                    next_states = self.get_next_states(state, symbol)
-                    next_state_set.update(next_states)
-                
+                for next_state in moves[symbol]:
+                    next_state_set.update(self.epsilon_closure(next_state))
                 next_state_set = frozenset(next_state_set)
-                
-                if next_state_set:
-                    new_transitions[(current_state_set, symbol)] = next_state_set
-                    
-                    if next_state_set not in new_states:
-                        new_states.append(next_state_set)
-                        states_queue.append(next_state_set)
-        
-        return FiniteAutomaton(
-            states=new_states,
+                next_id = subset_ids.get(next_state_set)
+                if next_id is None:
+                    next_id = len(subsets)
+                    subset_ids[next_state_set] = next_id
+                    subsets.append(next_state_set)
+                    states_queue.append(next_state_set)
+                new_transitions[(current_id, symbol)] = next_id
+
+        dfa = FiniteAutomaton(
+            states=list(range(len(subsets))),
             alphabet=self.alphabet,
             transitions=new_transitions,
-            start_state=initial_state_set,
+            start_state=0,
             final_states=new_final_states
         )
+        if with_subsets:
+            return dfa, dict(enumerate(subsets))
+        return dfa
+
+    def minimize(self):
+        dfa = self.to_dfa()
+        symbols = sorted(set(dfa.alphabet).union(*dfa._index.values()))
+
+        state_ids = {dfa.start_state: 0}
+        reachable = [dfa.start_state]
+        for state in reachable:
+            for next_states in dfa._index.get(state, {}).values():
+                for next_state in next_states:
+                    if next_state not in state_ids:
+                        state_ids[next_state] = len(reachable)
+                        reachable.append(next_state)
+
+        sink = len(reachable)
+        delta = {symbol: [sink] * (sink + 1) for symbol in symbols}
+        inverse = {symbol: [[] for _ in range(sink + 1)] for symbol in symbols}
+        for state, state_id in state_ids.items():
+            for symbol in symbols:
+                next_states = dfa._index.get(state, {}).get(symbol)
+                if next_states:
+                    delta[symbol][state_id] = state_ids[next(iter(next_states))]
+        for symbol in symbols:
+            for state_id, next_id in enumerate(delta[symbol]):
+                inverse[symbol][next_id].append(state_id)
+
+        final_states = set(dfa.final_states)
+        accepting = {state_ids[state] for state in reachable if state in final_states}
+        rejecting = set(range(sink + 1)) - accepting
+        blocks = [set(block) for block in (accepting, rejecting) if block]
+        block_of = [0] * (sink + 1)
+        for block_id, block in enumerate(blocks):
+            for state_id in block:
+                block_of[state_id] = block_id
+
+        worklist = deque()
+        pending = set()
+        if len(blocks) == 2:
+            smaller = 0 if len(blocks[0]) <= len(blocks[1]) else 1
+            for symbol in symbols:
+                worklist.append((smaller, symbol))
+                pending.add((smaller, symbol))
+
+        while worklist:
+            splitter_id, symbol = worklist.popleft()
+            pending.discard((splitter_id, symbol))
+
+            touched = {}
+            for state_id in blocks[splitter_id]:
+                for prev_id in inverse[symbol][state_id]:
+                    touched.setdefault(block_of[prev_id], []).append(prev_id)
+
+            for block_id, members in touched.items():
+                if len(members) == len(blocks[block_id]):
+                    continue
+                new_block = set(members)
+                blocks[block_id] -= new_block
+                new_id = len(blocks)
+                blocks.append(new_block)
+                for state_id in new_block:
+                    block_of[state_id] = new_id
+
+                for split_symbol in symbols:
+                    if (block_id, split_symbol) in pending:
+                        item = (new_id, split_symbol)
+                    elif len(new_block) <= len(blocks[block_id]):
+                        item = (new_id, split_symbol)
+                    else:
+                        item = (block_id, split_symbol)
+                    worklist.append(item)
+                    pending.add(item)
+
+        dead_block = block_of[sink]
+        start_block = block_of[0]
+        if start_block == dead_block:
+            return FiniteAutomaton([0], dfa.alphabet, {}, 0, set())
+
+        block_ids = {start_block: 0}
+        order = [start_block]
+        new_transitions = {}
+        new_final_states = set()
+        for block_id in order:
+            new_id = block_ids[block_id]
+            representative = next(iter(blocks[block_id]))
+            if representative in accepting:
+                new_final_states.add(new_id)
+            for symbol in symbols:
+                next_block = block_of[delta[symbol][representative]]
+                if next_block == dead_block:
+                    continue
+                if next_block not in block_ids:
+                    block_ids[next_block] = len(order)
+                    order.append(next_block)
+                new_transitions[(new_id, symbol)] = block_ids[next_block]
+
+        return FiniteAutomaton(
+            states=list(range(len(order))),
+            alphabet=dfa.alphabet,
+            transitions=new_transitions,
+            start_state=0,
+            final_states=new_final_states
+        )
+
+    def fingerprint(self):
+        content = [
+            sorted(map(_canonical_repr, self.states)),
+            sorted(self.alphabet),
+            _canonical_repr(self.start_state),
+            sorted(map(_canonical_repr, self.final_states)),
+            sorted(
+                (_canonical_repr(state), symbol, sorted(map(_canonical_repr, next_states)))
+                for state, symbol_map in self._index.items()
+                for symbol, next_states in symbol_map.items()
+            ),
+        ]
+        return hashlib.sha256(json.dumps(content).encode("utf-8")).hexdigest()
+
+    def compile(self, cache_dir=None):
+        key = (self._transitions.version, self._final_states.version)
+        if self._compiled is not None and self._compiled_key != key:
+            self._compiled = None
+        if cache_dir is not None:
+            path = os.path.join(cache_dir, f"{self.fingerprint()}.dfa")
+            self._compiled = CompiledAutomaton.load_or_build(path, self._compile_dfa, self._compiled)
+        elif self._compiled is None:
+            self._compiled = self._compile_dfa()
+        self._compiled_key = key
+        return self._compiled
+
+    def _compile_dfa(self):
+        dfa = self.to_dfa()
+        transitions = {}
+        for state, symbol_map in dfa._index.items():
+            for symbol, next_states in symbol_map.items():
+                transitions[(state, symbol)] = next(iter(next_states))
+        return CompiledAutomaton(
+            dfa.states, dfa.alphabet, transitions, dfa.start_state, dfa.final_states
+        )
+
+    def parallel_match(self, strings, workers=None, chunksize=1024, stats=None):
+        return parallel_match(self.compile(), strings, workers, chunksize, stats)
 
     def visualize(self):
-        dot_str = "digraph FiniteAutomaton {\n"
-        dot_str += "    rankdir=LR;\n"
-        dot_str += "    node [shape = circle];\n"
-        
-        for state in self.final_states:
-            state_str = str(state).replace("'", "").replace(" ", "")
-            dot_str += f'    "{state_str}" [shape = doublecircle];\n'
-        
-        dot_str += "    \"\" [shape=none,label=\"\"];\n"
-        start_str = str(self.start_state).replace("'", "").replace(" ", "")
-        dot_str += f'    "" -> "{start_str}";\n'
-        
-        for (state, symbol), next_states in self.transitions.items():
-            if not isinstance(next_states, list):
-                next_states = [next_states]
-                
-            state_str = str(state).replace("'", "").replace(" ", "")
-            for next_state in next_states:
-                next_state_str = str(next_state).replace("'", "").replace(" ", "")
-                dot_str += f'    "{state_str}" -> "{next_state_str}" [label="{symbol}"];\n'
-        
-        dot_str += "}"
-        return dot_str
+        return "".join(self._dot_lines())
+
+    def write_dot(self, out):
+        out.writelines(self._dot_lines())
+
+    def _dot_lines(self):
+        yield "digraph FiniteAutomaton {\n"
+        yield "    rankdir=LR;\n"
+        yield "    node [shape = circle];\n"
+
+        node_ids = {}
+        finals = set(self.final_states)
+        targets = (
+            next_state
+            for symbol_map in self._index.values()
+            for next_states in symbol_map.values()
+            for next_state in next_states
+        )
+        for state in itertools.chain(self.states, [self.start_state], finals, self._index, targets):
+            if state in node_ids:
+                continue
+            node_ids[state] = identifier = f"n{len(node_ids)}"
+            label = _dot_escape(str(state).replace("'", "").replace(" ", ""))
+            shape = ", shape = doublecircle" if state in finals else ""
+            yield f'    {identifier} [label="{label}"{shape}];\n'
+
+        yield '    "" [shape=none,label=""];\n'
+        yield f'    "" -> {node_ids[self.start_state]};\n'
+
+        for state, symbol_map in self._index.items():
+            source = node_ids[state]
+            labels = {}
+            for symbol, next_states in symbol_map.items():
+                label = _dot_escape(symbol) if symbol != EPSILON else "ε"
+                for next_state in next_states:
+                    labels.setdefault(next_state, []).append(label)
+            for next_state, edge_labels in labels.items():
+                yield f'    {source} -> {node_ids[next_state]} [label="{",".join(edge_labels)}"];\n'
+
+        yield "}\n"
+
+
+def _canonical_repr(value):
+    if isinstance(value, (set, frozenset)):
+        return f"{type(value).__name__}({{{', '.join(sorted(map(_canonical_repr, value)))}}})"
+    if isinstance(value, tuple):
+        return f"({', '.join(map(_canonical_repr, value))},)"
+    return repr(value)
+
+
+def _dot_escape(text):
+    return text.replace("\\", "\\\\").replace('"', '\\"')
 
 
-def visualize_finite_automaton(dot_data, filename="finite_automaton"):
+_render_executor = None
+_pending_renders = {}
+
+
+def visualize_finite_automaton(dot_data, filename="finite_automaton", background=False, view=None):
+    if view is None:
+        view = not _is_headless()
+    if not background:
+        return _render_dot(dot_data, filename, view)
+
+    global _render_executor
+    key = (filename, hashlib.sha256(dot_data.encode("utf-8")).hexdigest())
+    future = _pending_renders.get(key)
+    if future is None:
+        if _render_executor is None:
+            _render_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+        future = _pending_renders[key] = _render_executor.submit(_render_dot, dot_data, filename, view)
+        future.add_done_callback(lambda _: _pending_renders.pop(key, None))
+    return future
+
+
+def _is_headless():
+    if os.name == "nt" or sys.platform == "darwin":
+        return False
+    return not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+def _render_dot(dot_data, filename, view):
+    output = f"{filename}.png"
+    digest_path = f"{filename}.sha256"
+    digest = hashlib.sha256(dot_data.encode("utf-8")).hexdigest()
+    try:
+        with open(digest_path) as f:
+            unchanged = f.read().strip() == digest and os.path.exists(output)
+    except OSError:
+        unchanged = False
+    if unchanged and not view:
+        print(f"Visualization {output} is up to date")
+        return output
+
     try:
         import graphviz
-        dot = graphviz.Source(dot_data)
-        dot.render(filename, format="png", cleanup=True)
-        print(f"Visualization saved as {filename}.png")
-        dot.view()
+        if unchanged:
+            print(f"Visualization {output} is up to date")
+        else:
+            graphviz.Source(dot_data).render(filename, format="png", cleanup=True)
+            with open(digest_path, "w") as f:
+                f.write(digest)
+            print(f"Visualization saved as {output}")
+        if view:
+            graphviz.view(output)
+        return output
     except ImportError:
         print("Warning: graphviz Python package not found. Visualization skipped.")
         print("Install it with: pip install graphviz")
@@ -180,6 +603,7 @@ def visualize_finite_automaton(dot_data, filename="finite_automaton"):
     except Exception as e:
         print(f"Error during visualization: {e}")
         print("Visualization skipped, but DOT data is available in the output.")
+    return None
 
 
 def main():
@@ -201,6 +625,8 @@ def main():
     
     print("=== Analysis of Variant 15 Finite Automaton ===")
     
+    renders = []
+    
     is_det = fa.is_deterministic()
     print(f"\nIs the automaton deterministic? {is_det}")
     if not is_det:
@@ -221,39 +647,39 @@ def main():
     
     if not is_det:
         print("\nConverting NDFA to DFA:")
-        dfa = fa.to_dfa()
-        
+        dfa, subsets = fa.to_dfa(with_subsets=True)
+
+        def subset_str(state_id):
+            return ", ".join(sorted(subsets[state_id]))
+
         print("DFA States:")
         for state in dfa.states:
-            state_str = ", ".join(state)
-            print(f"State: {{{state_str}}}")
+            print(f"State {state}: {{{subset_str(state)}}}")
         
         print("\nDFA Transitions:")
         for (state, symbol), next_state in dfa.transitions.items():
-            state_str = ", ".join(state)
-            next_state_str = ", ".join(next_state)
-            print(f"δ({{{state_str}}}, {symbol}) = {{{next_state_str}}}")
+            print(f"δ({{{subset_str(state)}}}, {symbol}) = {{{subset_str(next_state)}}}")
         
         print("\nDFA Start State:")
-        start_state_str = ", ".join(dfa.start_state)
-        print(f"{{{start_state_str}}}")
+        print(f"{{{subset_str(dfa.start_state)}}}")
         
         print("\nDFA Final States:")
-        for state in dfa.final_states:
-            state_str = ", ".join(state)
-            print(f"{{{state_str}}}")
+        for state in sorted(dfa.final_states):
+            print(f"{{{subset_str(state)}}}")
         
         dfa_dot_data = dfa.visualize()
         print("\nDFA visualization data (can be used with Graphviz):")
         print(dfa_dot_data)
         
-        visualize_finite_automaton(dfa_dot_data, "dfa_automaton")
+        renders.append(visualize_finite_automaton(dfa_dot_data, "dfa_automaton", background=True))
     
     dot_data = fa.visualize()
     print("\nVisualization data for original NDFA (can be used with Graphviz):")
     print(dot_data)
     
-    visualize_finite_automaton(dot_data, "ndfa_automaton")
+    renders.append(visualize_finite_automaton(dot_data, "ndfa_automaton", background=True))
+    for render in renders:
+        render.result()
 
 
 if __name__ == "__main__":
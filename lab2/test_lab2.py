@@ -0,0 +1,379 @@
+import contextlib
+import io
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+from main import FiniteAutomaton, Grammar, EPSILON, visualize_finite_automaton
+
+
+def variant_15():
+    transitions = {
+        ('q0', 'a'): ['q0', 'q1'],
+        ('q1', 'b'): 'q2',
+        ('q2', 'a'): 'q2',
+        ('q2', 'b'): 'q3',
+        ('q2', 'c'): 'q0'
+    }
+    return FiniteAutomaton({'q0', 'q1', 'q2', 'q3'}, {'a', 'b', 'c'}, transitions, 'q0', {'q3'})
+
+
+class TestGrammar(unittest.TestCase):
+
+    def test_multi_character_symbols(self):
+        grammar = variant_15().to_regular_grammar()
+        self.assertEqual(grammar.classify_chomsky(), "Type 3: Regular Grammar")
+        grammar_type, diagnostics = grammar.classify()
+        self.assertEqual(grammar_type, 3)
+        self.assertIn(['a', 'q1'], [d["tokens"] for d in diagnostics])
+
+    def test_classification_levels(self):
+        context_free = Grammar({'S', 'A'}, {'a', 'b'}, {'S': ['aSb', 'A'], 'A': ['']}, 'S')
+        self.assertEqual(context_free.classify_chomsky(), "Type 2: Context-Free Grammar")
+        context_sensitive = Grammar({'S', 'B'}, {'a', 'b'}, {'S': ['aSB', 'ab'], 'aB': ['ab']}, 'S')
+        self.assertEqual(context_sensitive.classify_chomsky(), "Type 1: Context-Sensitive Grammar")
+
+    def test_stops_at_type_0(self):
+        grammar = Grammar({'S', 'A'}, {'a'}, {'S': ['aA'], 'aA': ['', 'a'], 'A': ['a']}, 'S')
+        grammar_type, diagnostics = grammar.classify()
+        self.assertEqual(grammar_type, 0)
+        self.assertEqual(len(diagnostics), 2)
+        self.assertEqual(diagnostics[-1]["type"], 0)
+
+    def test_interned_round_trip(self):
+        grammar = Grammar({'S', 'A'}, {'a', 'b'}, {'S': ['aSb', 'A', 'aSb'], 'A': ['', ['a', 'A']]}, 'S')
+        interned = grammar.to_interned()
+        self.assertEqual(len(interned), 4)
+        restored = Grammar.from_interned(interned)
+        self.assertEqual(restored.P, {'S': ['aSb', 'A'], 'A': ['', 'aA']})
+        self.assertEqual((restored.Vn, restored.Vt, restored.S), ({'S', 'A'}, {'a', 'b'}, 'S'))
+
+
+class TestFiniteAutomaton(unittest.TestCase):
+
+    def test_get_next_states(self):
+        fa = variant_15()
+        self.assertEqual(sorted(fa.get_next_states('q0', 'a')), ['q0', 'q1'])
+        self.assertEqual(fa.get_next_states('q1', 'b'), ['q2'])
+        self.assertEqual(fa.get_next_states('q3', 'a'), [])
+
+    def test_add_transition_updates_index(self):
+        fa = variant_15()
+        fa.add_transition('q3', 'a', 'q1')
+        fa.add_transition('q3', 'a', 'q2')
+        self.assertFalse(fa.is_deterministic())
+        self.assertEqual(sorted(fa.get_next_states('q3', 'a')), ['q1', 'q2'])
+        self.assertEqual(fa.transitions[('q3', 'a')], ['q1', 'q2'])
+        fa.add_transition('q3', 'a', 'q2')
+        self.assertEqual(fa.transitions[('q3', 'a')], ['q1', 'q2'])
+
+    def test_wide_transition_fan_out(self):
+        fa = FiniteAutomaton({'q'}, {'a'}, {}, 'q', set())
+        for target in range(20000):
+            fa.add_transition('q', 'a', target)
+        fa.add_transition('q', 'a', 7)
+        self.assertEqual(len(fa.transitions[('q', 'a')]), 20000)
+        fa.transitions[('q', 'a')].extend(['x', 'y'])
+        fa.transitions[('q', 'a')] += ['z']
+        self.assertEqual(len(fa.get_next_states('q', 'a')), 20003)
+        self.assertTrue({'x', 'y', 'z'} <= set(fa.get_next_states('q', 'a')))
+
+    def test_transitions_edits_update_index(self):
+        fa = variant_15()
+        fa.transitions[('q1', 'a')] = 'q0'
+        self.assertEqual(fa.get_next_states('q1', 'a'), ['q0'])
+        self.assertEqual(fa.visualize().count('[label="a"]'), 4)
+        self.assertTrue(fa.compile().matches("abb"))
+        fa.transitions[('q0', 'a')].remove('q1')
+        self.assertTrue(fa.is_deterministic())
+        self.assertFalse(fa.compile().matches("abb"))
+        del fa.transitions[('q1', 'a')]
+        fa.transitions[('q0', 'a')].append('q2')
+        self.assertEqual(sorted(fa.get_next_states('q0', 'a')), ['q0', 'q2'])
+        self.assertEqual(fa.get_next_states('q1', 'a'), [])
+        copy = pickle.loads(pickle.dumps(fa))
+        copy.transitions[('q0', 'a')].append('q3')
+        self.assertEqual(sorted(copy.get_next_states('q0', 'a')), ['q0', 'q2', 'q3'])
+
+    def test_reassigned_transitions_drop_closures(self):
+        fa = FiniteAutomaton({'q0', 'q1', 'q2'}, {'a'}, {('q0', EPSILON): 'q1'}, 'q0', {'q2'})
+        self.assertEqual(fa.epsilon_closure('q0'), frozenset(['q0', 'q1']))
+        fa.transitions = {('q0', EPSILON): 'q2'}
+        self.assertEqual(fa.epsilon_closure('q0'), frozenset(['q0', 'q2']))
+        self.assertEqual(fa.to_dfa().final_states, {0})
+        self.assertTrue(fa.compile().matches(''))
+
+    def test_unpickled_copy_recompiles(self):
+        fa = FiniteAutomaton({'q0'}, {'a', 'b'}, {('q0', 'a'): 'q0'}, 'q0', {'q0'})
+        fa.transitions[('q0', 'a')] = 'q0'
+        self.assertFalse(fa.compile().matches('b'))
+        copy = pickle.loads(pickle.dumps(fa))
+        copy.transitions[('q0', 'b')] = 'q0'
+        self.assertTrue(copy.compile().matches('b'))
+
+    def test_constructor_copies_transitions(self):
+        transitions = {('q0', 'a'): 'q0'}
+        fa = FiniteAutomaton({'q0'}, {'a', 'b'}, transitions, 'q0', {'q0'})
+        transitions[('q0', 'b')] = 'q0'
+        self.assertEqual(fa.get_next_states('q0', 'b'), [])
+        self.assertIsNot(fa.transitions, transitions)
+
+    def test_to_regular_grammar(self):
+        grammar = variant_15().to_regular_grammar()
+        self.assertEqual(sorted(grammar.P['q0']), ['aq0', 'aq1'])
+        self.assertEqual(sorted(grammar.P['q2']), ['aq2', 'b', 'bq3', 'cq0'])
+        self.assertEqual(grammar.P['q3'], [''])
+
+    def test_minimized_to_regular_grammar(self):
+        minimal = variant_15().minimize()
+        grammar = minimal.to_regular_grammar()
+        self.assertEqual(grammar.S, '0')
+        self.assertEqual(grammar.Vn, {'0', '1', '2', '3'})
+        self.assertEqual(sorted(grammar.P['0']), ['a1'])
+        self.assertEqual(grammar.classify_chomsky(), "Type 3: Regular Grammar")
+
+    def test_to_dfa_uses_integer_states(self):
+        dfa, subsets = variant_15().to_dfa(with_subsets=True)
+        self.assertEqual(dfa.states, [0, 1, 2, 3])
+        self.assertEqual(dfa.start_state, 0)
+        self.assertEqual(subsets.keys(), set(dfa.states))
+        self.assertEqual(subsets[0], frozenset(['q0']))
+        self.assertEqual(subsets[dfa.transitions[(0, 'a')]], frozenset(['q0', 'q1']))
+        self.assertEqual({subsets[s] for s in dfa.final_states}, {frozenset(['q3'])})
+        self.assertTrue(dfa.is_deterministic())
+
+    def test_to_dfa_deterministic_returns_self(self):
+        fa = FiniteAutomaton({'q0'}, {'a'}, {('q0', 'a'): 'q0'}, 'q0', {'q0'})
+        self.assertIs(fa.to_dfa(), fa)
+        dfa, subsets = fa.to_dfa(with_subsets=True)
+        self.assertIs(dfa, fa)
+        self.assertEqual(subsets, {'q0': frozenset(['q0'])})
+
+    def test_epsilon_closure_handles_cycles(self):
+        transitions = {
+            ('p', EPSILON): ['q'],
+            ('q', EPSILON): ['r'],
+            ('r', EPSILON): ['p', 's'],
+            ('s', 'a'): 't',
+        }
+        fa = FiniteAutomaton({'p', 'q', 'r', 's', 't'}, {'a'}, transitions, 'p', {'t'})
+        self.assertEqual(fa.epsilon_closure('q'), frozenset(['p', 'q', 'r', 's']))
+        self.assertEqual(fa.epsilon_closure('s'), frozenset(['s']))
+        self.assertEqual(fa.epsilon_closure('t'), frozenset(['t']))
+        self.assertFalse(fa.is_deterministic())
+
+        fa.add_transition('t', EPSILON, 'p')
+        self.assertEqual(fa.epsilon_closure('t'), frozenset(['p', 'q', 'r', 's', 't']))
+
+    def test_to_dfa_with_epsilon_transitions(self):
+        transitions = {
+            ('q0', EPSILON): ['q1', 'q2'],
+            ('q1', 'a'): 'q1',
+            ('q2', 'b'): 'q3',
+            ('q3', EPSILON): 'q0',
+        }
+        fa = FiniteAutomaton({'q0', 'q1', 'q2', 'q3'}, {'a', 'b'}, transitions, 'q0', {'q1', 'q3'})
+        dfa, subsets = fa.to_dfa(with_subsets=True)
+        self.assertTrue(dfa.is_deterministic())
+        self.assertEqual(subsets[0], frozenset(['q0', 'q1', 'q2']))
+        self.assertIn(0, dfa.final_states)
+        after_b = dfa.transitions[(0, 'b')]
+        self.assertEqual(subsets[after_b], frozenset(['q0', 'q1', 'q2', 'q3']))
+
+    def test_minimize_merges_equivalent_states(self):
+        transitions = {
+            ('q0', 'a'): 'q1',
+            ('q0', 'b'): 'q2',
+            ('q1', 'a'): 'q3',
+            ('q2', 'a'): 'q3',
+            ('q3', 'a'): 'q3',
+            ('q4', 'a'): 'q3',
+            ('q0', 'c'): 'q5',
+        }
+        fa = FiniteAutomaton({'q0', 'q1', 'q2', 'q3', 'q4', 'q5'}, {'a', 'b', 'c'}, transitions, 'q0', {'q3'})
+        minimal = fa.minimize()
+        self.assertEqual(len(minimal.states), 3)
+        self.assertEqual(minimal.transitions[(0, 'a')], minimal.transitions[(0, 'b')])
+        self.assertNotIn((0, 'c'), minimal.transitions)
+        self.assertEqual(len(minimal.final_states), 1)
+
+    def test_minimize_nfa(self):
+        minimal = variant_15().minimize()
+        self.assertTrue(minimal.is_deterministic())
+        self.assertEqual(len(minimal.states), 4)
+
+    def test_minimize_keeps_symbols_outside_alphabet(self):
+        fa = FiniteAutomaton({'p', 'q'}, {'a'}, {('p', 'a'): 'q', ('p', 'b'): 'q'}, 'p', {'q'})
+        minimal = fa.minimize()
+        for word in ['a', 'b', 'ab', '']:
+            self.assertEqual(minimal.compile().matches(word), fa.compile().matches(word), word)
+
+    def test_minimize_empty_language(self):
+        fa = FiniteAutomaton({'q0', 'q1'}, {'a'}, {('q0', 'a'): 'q1'}, 'q0', set())
+        minimal = fa.minimize()
+        self.assertEqual(minimal.states, [0])
+        self.assertEqual(minimal.transitions, {})
+        self.assertEqual(minimal.final_states, set())
+
+    def test_compile_matches(self):
+        compiled = variant_15().compile()
+        self.assertTrue(compiled.matches("abb"))
+        self.assertTrue(compiled.matches("aabcabb"))
+        self.assertFalse(compiled.matches("ab"))
+        self.assertEqual(compiled.match_many(["abb", "abac", "x"]), [True, False, False])
+
+    def test_match_batch(self):
+        compiled = variant_15().compile()
+        strings = ["abb", "aabcabb", "ab", "", "abbx", "abab"]
+        expected = compiled.match_many(strings)
+        self.assertEqual(list(compiled.match_batch(compiled.encode_batch(strings))), expected)
+        codes, offsets = compiled.encode_batch(strings, padded=False)
+        self.assertEqual(list(compiled.match_batch(codes, offsets)), expected)
+
+    def test_add_transition_invalidates_compiled(self):
+        fa = variant_15()
+        self.assertFalse(fa.compile().matches("ac"))
+        fa.add_transition('q1', 'c', 'q3')
+        self.assertTrue(fa.compile().matches("ac"))
+
+    def test_compile_follows_final_and_start_states(self):
+        fa = variant_15()
+        self.assertTrue(fa.compile().matches("abb"))
+        fa.final_states = {'q0'}
+        self.assertFalse(fa.compile().matches("abb"))
+        self.assertTrue(fa.compile().matches(""))
+        fa.final_states.add('q2')
+        self.assertTrue(fa.compile().matches("ab"))
+        fa.start_state = 'q2'
+        self.assertTrue(fa.compile().matches("c"))
+
+    def test_compile_cache_roundtrip(self):
+        strings = ["abb", "aabcabb", "ab", "", "abbx", "abab"]
+        expected = variant_15().compile().match_many(strings)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            fa = variant_15()
+            fa.compile(cache_dir)
+            path = os.path.join(cache_dir, fa.fingerprint() + ".dfa")
+            self.assertTrue(os.path.exists(path))
+            loaded = variant_15().compile(cache_dir)
+            self.assertIsInstance(loaded.table, memoryview)
+            self.assertEqual(loaded.match_many(strings), expected)
+            self.assertEqual(list(loaded.match_batch(loaded.encode_batch(strings))), expected)
+            self.assertEqual(pickle.loads(pickle.dumps(loaded)).match_many(strings), expected)
+
+            changed = variant_15()
+            changed.add_transition('q1', 'c', 'q3')
+            self.assertNotEqual(changed.fingerprint(), fa.fingerprint())
+            self.assertTrue(changed.compile(cache_dir).matches("ac"))
+
+            with open(path, "wb") as f:
+                f.write(b"stale")
+            self.assertEqual(variant_15().compile(cache_dir).match_many(strings), expected)
+
+    def test_compile_cache_saves_existing_table(self):
+        fa = variant_15()
+        compiled = fa.compile()
+        with tempfile.TemporaryDirectory() as cache_dir:
+            self.assertIs(fa.compile(cache_dir), compiled)
+            self.assertTrue(os.path.exists(os.path.join(cache_dir, fa.fingerprint() + ".dfa")))
+            self.assertIsInstance(variant_15().compile(cache_dir).table, memoryview)
+
+    def test_visualize_merges_parallel_edges(self):
+        fa = FiniteAutomaton(['p', 'q'], {'a', 'b'}, {('p', 'a'): 'q', ('p', 'b'): 'q', ('q', 'a'): 'q'}, 'p', ['q'])
+        dot = fa.visualize()
+        self.assertIn('n0 [label="p"];', dot)
+        self.assertIn('n1 [label="q", shape = doublecircle];', dot)
+        self.assertIn('n0 -> n1 [label="a,b"];', dot)
+        self.assertEqual(dot.count("->"), 3)
+
+        out = io.StringIO()
+        fa.write_dot(out)
+        self.assertEqual(out.getvalue(), dot)
+
+    def test_fingerprint_ignores_hash_seed(self):
+        script = (
+            "from main import FiniteAutomaton\n"
+            "states = [frozenset({'q0', 'q1', 'q2'}), frozenset({('q3', 1), ('q4', 2)})]\n"
+            "fa = FiniteAutomaton(set(states), {'a'}, {(states[0], 'a'): states[1]}, states[0], {states[1]})\n"
+            "print(fa.fingerprint())\n"
+        )
+        digests = {
+            subprocess.run(
+                [sys.executable, "-c", script], capture_output=True, text=True, check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__)), env=dict(os.environ, PYTHONHASHSEED=seed),
+            ).stdout
+            for seed in ("1", "2", "3")
+        }
+        self.assertEqual(len(digests), 1)
+
+    def test_parallel_match(self):
+        fa = variant_15()
+        strings = ["abb", "abac", "aabcabb", "", "ab"] * 50
+        stats = {}
+        results = list(fa.parallel_match(iter(strings), workers=2, chunksize=7, stats=stats))
+        self.assertEqual(results, fa.compile().match_many(strings))
+        self.assertEqual(stats["strings"], len(strings))
+        self.assertEqual(stats["chunks"], (len(strings) + 6) // 7)
+        self.assertGreater(stats["strings_per_second"], 0)
+
+
+
+class FakeSource:
+    renders = []
+    views = []
+
+    def __init__(self, dot_data):
+        self.dot_data = dot_data
+
+    def render(self, filename, format, cleanup):
+        FakeSource.renders.append(filename)
+        with open(f"{filename}.{format}", "w") as f:
+            f.write(self.dot_data)
+
+
+class TestVisualization(unittest.TestCase):
+
+    def setUp(self):
+        FakeSource.renders = []
+        FakeSource.views = []
+        graphviz = types.SimpleNamespace(Source=FakeSource, view=FakeSource.views.append)
+        patcher = mock.patch.dict(sys.modules, {"graphviz": graphviz})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_background_render_reuses_unchanged_output(self):
+        dot = variant_15().visualize()
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+            filename = os.path.join(directory, "fa")
+            future = visualize_finite_automaton(dot, filename, background=True, view=False)
+            self.assertEqual(future.result(timeout=10), filename + ".png")
+            self.assertEqual(visualize_finite_automaton(dot, filename, view=False), filename + ".png")
+            self.assertEqual(FakeSource.renders, [filename])
+
+            visualize_finite_automaton(dot.replace("rankdir=LR", "rankdir=TB"), filename, view=False)
+            self.assertEqual(FakeSource.renders, [filename, filename])
+
+    def test_headless_skips_view(self):
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()), \
+                mock.patch.dict(os.environ, {"DISPLAY": "", "WAYLAND_DISPLAY": ""}), \
+                mock.patch.object(sys, "platform", "linux"):
+            filename = os.path.join(directory, "fa")
+            self.assertEqual(visualize_finite_automaton(variant_15().visualize(), filename), filename + ".png")
+        self.assertEqual(FakeSource.views, [])
+
+    def test_view_opens_reused_output(self):
+        dot = variant_15().visualize()
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+            filename = os.path.join(directory, "fa")
+            visualize_finite_automaton(dot, filename, view=True)
+            visualize_finite_automaton(dot, filename, view=True)
+            self.assertEqual(FakeSource.renders, [filename])
+            self.assertEqual(FakeSource.views, [filename + ".png"] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,214 @@
+class ParseForest:
+    def __init__(self, root, nodes, tokens):
+        self.root = root
+        self.nodes = nodes
+        self.tokens = tokens
+
+    def count_trees(self):
+        counts = {}
+
+        def count(node):
+            if node in counts:
+                return counts[node]
+            stack = [(node, False)]
+            while stack:
+                current, expanded = stack.pop()
+                if current in counts:
+                    continue
+                children = [child for alternative in self.nodes[current] if len(alternative) == 3
+                            for child in (alternative[1], alternative[2])]
+                if not expanded:
+                    stack.append((current, True))
+                    stack.extend((child, False) for child in children if child not in counts)
+                    continue
+                total = 0
+                for alternative in self.nodes[current]:
+                    if len(alternative) == 1:
+                        total += 1
+                    else:
+                        total += counts[alternative[1]] * counts[alternative[2]]
+                counts[current] = total
+            return counts[node]
+
+        return count(self.root) if self.root is not None else 0
+
+    def tree(self, node=None):
+        node = node or self.root
+        if node is None:
+            return None
+        trees = {}
+        stack = [(node, False)]
+        while stack:
+            current, expanded = stack.pop()
+            alternative = self.nodes[current][0]
+            if len(alternative) == 1:
+                trees[current] = (current[0], alternative[0])
+            elif expanded:
+                trees[current] = (current[0], trees[alternative[1]], trees[alternative[2]])
+            else:
+                stack.append((current, True))
+                stack.append((alternative[2], False))
+                stack.append((alternative[1], False))
+        return trees[node]
+
+
+# The chart is stored transposed: instead of a non-terminal bitset per cell,
+# spans[A][length] is a bitset of the start positions of A's spans of that
+# length. For the binary rules, all lengths of a non-terminal are also packed
+# into one int of width-bit rows. left_rows[A] keeps row l for spans of
+# length l, with bit i set for a span starting at i. right_rows[A] keeps its
+# newest length in row 0 and older lengths in higher rows, with bit e - base
+# set for a span ending at e.
+#
+# For a new length L, shifting right_rows[C] left by L - right_length[C] rows
+# puts C's spans of length L - k in row k, and shifting it right by L - base
+# bits turns end position k + i + (L - k) into start position i. Row k of
+# left_rows[B] & aligned right_rows[C] then holds the starts i where
+# B covers (i, i + k) and C covers (i + k, i + L), and folding all rows
+# together with OR gives every split at once.
+#
+# A span of length L can only start below needed = n - L + 1, so columns at
+# or above needed are scratch space and are masked off after folding. The
+# bit-level shift above lets low columns of one row borrow into the top of
+# the row below. Those columns are at least width - L + base, and width was
+# chosen at least n - base + 1 wide, so they land at needed or above.
+# _repack_rows narrows every row to the new needed range once it shrinks by
+# an eighth, dropping the low L - base columns of right rows on the way. It
+# only truncates columns at or above needed, and bits that the drop moves
+# across a row edge land in the same scratch columns.
+def _repack_rows(bits, rows, width, new_width, drop=0):
+    size, new_size = width // 8, new_width // 8
+    data = (bits >> drop).to_bytes(rows * size, "little")
+    packed = bytearray(rows * new_size)
+    for k in range(new_size):
+        packed[k::new_size] = data[k::size]
+    return int.from_bytes(packed, "little")
+
+
+def _fold_plan(rows, width):
+    plan = []
+    while rows > 1:
+        rows = (rows + 1) // 2
+        plan.append((rows * width, (1 << rows * width) - 1))
+    return plan
+
+
+class CYKParser:
+    def __init__(self, grammar):
+        self.nonterminals = sorted(grammar.vn)
+        self.ids = {nt: i for i, nt in enumerate(self.nonterminals)}
+        self.start = self.ids.get(grammar.s)
+        self.terminal_rules = {}
+        self.rules_by_pair = {}
+        self.rules_by_lhs = {}
+
+        for lhs, rhs_list in grammar.p.items():
+            lhs_id = self.ids[lhs]
+            for rhs in rhs_list:
+                if len(rhs) == 1 and rhs[0] in grammar.vt:
+                    self.terminal_rules[rhs[0]] = self.terminal_rules.get(rhs[0], 0) | 1 << lhs_id
+                elif len(rhs) == 2 and rhs[0] in self.ids and rhs[1] in self.ids:
+                    pair = (self.ids[rhs[0]], self.ids[rhs[1]])
+                    if pair not in self.rules_by_lhs.get(lhs_id, ()):
+                        by_right = self.rules_by_pair.setdefault(pair[0], {})
+                        by_right[pair[1]] = by_right.get(pair[1], 0) | 1 << lhs_id
+                        self.rules_by_lhs.setdefault(lhs_id, []).append(pair)
+                else:
+                    raise ValueError(f"Production {lhs} -> {''.join(rhs)} is not in Chomsky Normal Form")
+
+    def spans(self, tokens):
+        n = len(tokens)
+        count = len(self.nonterminals)
+        spans = [[0] * (n + 1) for _ in range(count)]
+
+        for i, token in enumerate(tokens):
+            bits = self.terminal_rules.get(token, 0)
+            while bits:
+                low = bits & -bits
+                spans[low.bit_length() - 1][1] |= 1 << i
+                bits ^= low
+
+        width = -(-(n + 1) // 8) * 8
+        base = 0
+        left_rows = [spans[nt][1] << width for nt in range(count)]
+        right_rows = [spans[nt][1] << 1 for nt in range(count)]
+        right_length = [1] * count
+
+        for length in range(2, n + 1):
+            needed = n - length + 1
+            if needed * 8 <= width * 7:
+                new_width = -(-needed // 8) * 8
+                left_rows = [_repack_rows(bits, length, width, new_width) for bits in left_rows]
+                right_rows = [_repack_rows(bits, length, width, new_width, length - base) for bits in right_rows]
+                width, base = new_width, length
+
+            plan = _fold_plan(length, width)
+            aligned = {}
+            found = {}
+            for left, by_right in self.rules_by_pair.items():
+                left_bits = left_rows[left]
+                if not left_bits:
+                    continue
+                for right, lhs_bits in by_right.items():
+                    right_bits = aligned.get(right)
+                    if right_bits is None:
+                        right_bits = aligned[right] = right_rows[right] << (
+                            (length - right_length[right]) * width - length + base)
+                    matched = left_bits & right_bits
+                    if not matched:
+                        continue
+                    while lhs_bits:
+                        low = lhs_bits & -lhs_bits
+                        lhs = low.bit_length() - 1
+                        found[lhs] = found.get(lhs, 0) | matched
+                        lhs_bits ^= low
+            for lhs, starts in found.items():
+                for cut, low in plan:
+                    starts = starts & low | starts >> cut
+                starts &= (1 << needed) - 1
+                if starts:
+                    spans[lhs][length] = starts
+                    left_rows[lhs] |= starts << length * width
+                    right_rows[lhs] = (right_rows[lhs] << (length - right_length[lhs]) * width
+                                       | starts << length - base)
+                    right_length[lhs] = length
+
+        return spans
+
+    def recognize(self, tokens):
+        tokens = list(tokens)
+        if not tokens or self.start is None:
+            return False
+        return bool(self.spans(tokens)[self.start][len(tokens)] & 1)
+
+    def parse(self, tokens):
+        tokens = list(tokens)
+        if not tokens or self.start is None:
+            return ParseForest(None, {}, tokens)
+        spans = self.spans(tokens)
+        n = len(tokens)
+        if not spans[self.start][n] & 1:
+            return ParseForest(None, {}, tokens)
+
+        names = self.nonterminals
+        root = (names[self.start], 0, n)
+        nodes = {}
+        stack = [(self.start, 0, n)]
+        while stack:
+            nt, i, j = stack.pop()
+            key = (names[nt], i, j)
+            if key in nodes:
+                continue
+            alternatives = []
+            if j == i + 1 and self.terminal_rules.get(tokens[i], 0) >> nt & 1:
+                alternatives.append((tokens[i],))
+            for left, right in self.rules_by_lhs.get(nt, ()):
+                left_spans = spans[left]
+                right_spans = spans[right]
+                for k in range(i + 1, j):
+                    if left_spans[k - i] >> i & 1 and right_spans[j - k] >> k & 1:
+                        alternatives.append((k, (names[left], i, k), (names[right], k, j)))
+                        stack.append((left, i, k))
+                        stack.append((right, k, j))
+            nodes[key] = alternatives
+        return ParseForest(root, nodes, tokens)
@@ -0,0 +1,124 @@
+class EarleySet:
+    def __init__(self):
+        self.items = []
+        self.seen = set()
+        self.waiting = {}
+        self.predicted = set()
+        self.leo = {}
+        self.completed = set()
+
+    def add(self, item):
+        if item not in self.seen:
+            self.seen.add(item)
+            self.items.append(item)
+
+
+class EarleyRecognizer:
+    def __init__(self, grammar):
+        self.start = grammar.s
+        self.nonterminals = set(grammar.vn)
+        self.nullable = grammar.nullable_symbols()
+        self.rules = []
+        self.rules_by_lhs = {}
+        for lhs, rhs_list in grammar.p.items():
+            for rhs in rhs_list:
+                self.rules_by_lhs.setdefault(lhs, []).append(len(self.rules))
+                self.rules.append((lhs, tuple(rhs)))
+        self.accept_rule = len(self.rules)
+        self.rules.append((None, (self.start,)))
+        self.reset()
+
+    def reset(self):
+        first = EarleySet()
+        first.add((self.accept_rule, 0, 0))
+        self.sets = [first]
+        self._close(0)
+
+    @property
+    def position(self):
+        return len(self.sets) - 1
+
+    def feed(self, token):
+        current = self.sets[-1]
+        following = EarleySet()
+        for rule, dot, origin in current.waiting.get(token, ()):
+            following.add((rule, dot + 1, origin))
+        self.sets.append(following)
+        self._close(len(self.sets) - 1)
+        return bool(following.items)
+
+    def feed_many(self, tokens):
+        alive = bool(self.sets[-1].items)
+        for token in tokens:
+            alive = self.feed(token)
+        return alive
+
+    def accepts(self):
+        return (self.accept_rule, 1, 0) in self.sets[-1].seen
+
+    def recognize(self, tokens):
+        self.reset()
+        self.feed_many(tokens)
+        return self.accepts()
+
+    def _close(self, position):
+        earley_set = self.sets[position]
+        items = earley_set.items
+        index = 0
+        while index < len(items):
+            item = items[index]
+            index += 1
+            rule, dot, origin = item
+            lhs, rhs = self.rules[rule]
+
+            if dot == len(rhs):
+                if origin < position and (lhs, origin) not in earley_set.completed:
+                    earley_set.completed.add((lhs, origin))
+                    self._complete(lhs, origin, earley_set)
+                continue
+
+            symbol = rhs[dot]
+            earley_set.waiting.setdefault(symbol, []).append(item)
+            if symbol in self.nonterminals:
+                if symbol not in earley_set.predicted:
+                    earley_set.predicted.add(symbol)
+                    for predicted_rule in self.rules_by_lhs.get(symbol, ()):
+                        earley_set.add((predicted_rule, 0, position))
+                if symbol in self.nullable:
+                    earley_set.add((rule, dot + 1, origin))
+
+    def _complete(self, lhs, origin, earley_set):
+        topmost = self._leo_item(origin, lhs)
+        if topmost is not None:
+            earley_set.add(topmost)
+            return
+        for rule, dot, item_origin in self.sets[origin].waiting.get(lhs, ()):
+            earley_set.add((rule, dot + 1, item_origin))
+
+    def _leo_item(self, position, symbol):
+        chain = []
+        result = None
+        while True:
+            memo = self.sets[position].leo
+            if symbol in memo:
+                result = memo[symbol]
+                break
+            waiting = self.sets[position].waiting.get(symbol, ())
+            if len(waiting) != 1:
+                memo[symbol] = None
+                break
+            rule, dot, origin = waiting[0]
+            lhs, rhs = self.rules[rule]
+            if dot + 1 != len(rhs):
+                memo[symbol] = None
+                break
+            chain.append((position, symbol, (rule, dot + 1, origin)))
+            if origin >= position:
+                break
+            position, symbol = origin, lhs
+
+        for position, symbol, completed in reversed(chain):
+            if result is None:
+                result = completed
+            self.sets[position].leo[symbol] = result
+        return result
@@ -1,3 +1,22 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import tracemalloc
+from array import array
+from collections import deque
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lfa_common.interned import TERMINAL, NONTERMINAL, SymbolTable, InternedGrammar
+from cyk import CYKParser
+from earley import EarleyRecognizer
+
+GRAMMAR_MAGIC = b"LFG2"
+GRAMMAR_HEADER = struct.Struct("<4sBBxxIIII")
+
 class Grammar:
     def __init__(self, vn, vt, p, s):
         self.vn = vn
@@ -13,123 +32,370 @@ class Grammar:
             if new_symbol not in self.vn:
                 return new_symbol
 
-    def remove_epsilon_productions(self):
+    def to_interned(self):
+        symbols = SymbolTable()
+        for symbol in sorted(self.vt):
+            symbols.intern(symbol, TERMINAL)
+        for symbol in sorted(self.vn):
+            symbols.intern(symbol, NONTERMINAL)
+        interned = InternedGrammar(symbols, symbols.ids[self.s] if self.s in self.vn else None)
+        for lhs, rhs_list in self.p.items():
+            lhs_id = symbols.intern(lhs, NONTERMINAL)
+            interned.productions.setdefault(lhs_id, {})
+            for rhs in rhs_list:
+                interned.add(lhs_id, symbols.tokenize(rhs))
+        return interned
+
+    @classmethod
+    def from_interned(cls, interned):
+        symbols = interned.symbols.symbols
+        kinds = interned.symbols.kinds
+        vn = {symbol for symbol, kind in zip(symbols, kinds) if kind == NONTERMINAL}
+        vt = {symbol for symbol, kind in zip(symbols, kinds) if kind == TERMINAL}
+        p = {}
+        for lhs, rhs_set in interned.productions.items():
+            p[symbols[lhs]] = [[symbols[token] for token in rhs] for rhs in rhs_set]
+        return cls(vn, vt, p, symbols[interned.start] if interned.start is not None else None)
+
+    def fingerprint(self):
+        content = [sorted(self.vn), sorted(self.vt), self.s, [[lhs, rhs_list] for lhs, rhs_list in self.p.items()],
+                   self.new_symbol_index]
+        return hashlib.sha256(json.dumps(content).encode("utf-8")).hexdigest()
+
+    def save(self, path):
+        interned = self.to_interned()
+        table = array('i')
+        for lhs, rhs_set in interned.productions.items():
+            table.extend((lhs, len(rhs_set)))
+            for rhs in rhs_set:
+                table.append(len(rhs))
+                table.extend(rhs)
+        blob = json.dumps([interned.symbols.symbols, self.s]).encode("utf-8")
+        blob += b"\0" * (-(GRAMMAR_HEADER.size + len(blob)) % table.itemsize)
+        header = GRAMMAR_HEADER.pack(GRAMMAR_MAGIC, sys.byteorder == "big", table.itemsize, len(interned.symbols.symbols),
+                                     self.new_symbol_index, len(blob), len(table))
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(header)
+            f.write(blob)
+            f.write(bytes(table))
+            f.write(bytes(interned.symbols.kinds))
+        os.replace(temporary, path)
+
+    # Unlike CompiledAutomaton.load, this reads the whole table up front: a
+    # Grammar holds its productions as plain lists, so every one of them is
+    # rebuilt before the caller can use the result anyway.
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if len(mapped) < GRAMMAR_HEADER.size:
+                raise ValueError(f"{path} is not a serialized grammar")
+            magic, big_endian, itemsize, count, new_symbol_index, blob_size, length = GRAMMAR_HEADER.unpack_from(mapped)
+            offset = GRAMMAR_HEADER.size + blob_size
+            table_end = offset + length * itemsize
+            if magic != GRAMMAR_MAGIC or itemsize not in (4, 8) or len(mapped) != table_end + count:
+                raise ValueError(f"{path} is not a serialized grammar")
+            code = "i" if itemsize == 4 else "q"
+            table = struct.unpack_from(f"{'>' if big_endian else '<'}{length}{code}", mapped, offset)
+
+            header = json.loads(mapped[GRAMMAR_HEADER.size:offset].rstrip(b"\0"))
+            if (not isinstance(header, list) or len(header) != 2 or not isinstance(header[0], list)
+                    or len(header[0]) != count or not all(isinstance(name, str) for name in header[0])):
+                raise ValueError(f"{path} is not a serialized grammar")
+            names, start = header
+            symbols = SymbolTable()
+            for symbol, kind in zip(names, mapped[table_end:]):
+                symbols.intern(symbol, kind)
+
+        interned = InternedGrammar(symbols)
+        index = 0
+        while index < length:
+            if index + 2 > length or not 0 <= table[index] < count or table[index + 1] < 0:
+                raise ValueError(f"{path} has a corrupt production table")
+            lhs, rhs_count = table[index], table[index + 1]
+            index += 2
+            rhs_set = interned.productions.setdefault(lhs, {})
+            for _ in range(rhs_count):
+                if index >= length or not 0 <= table[index] <= length - index - 1:
+                    raise ValueError(f"{path} has a corrupt production table")
+                size = table[index]
+                rhs = table[index + 1:index + 1 + size]
+                if not all(0 <= token < count for token in rhs):
+                    raise ValueError(f"{path} has a corrupt production table")
+                rhs_set[rhs] = None
+                index += 1 + size
+        grammar = cls.from_interned(interned)
+        grammar.s = start
+        grammar.new_symbol_index = new_symbol_index
+        return grammar
+
+    def nullable_symbols(self):
         nullable = set()
-        changed = True
-        while changed:
-            changed = False
-            for lhs, rhs in self.p.items():
-                if lhs in nullable:
-                    continue
-                for production in rhs:
-                    if not production:
-                        nullable.add(lhs)
-                        changed = True
-                        break
-                    elif all(symbol in nullable for symbol in production):
-                        nullable.add(lhs)
-                        changed = True
-                        break
+        queue = deque()
+        occurrences = {}
+        remaining = []
+        lhs_of = []
+        for lhs, rhs_list in self.p.items():
+            for rhs in rhs_list:
+                index = len(remaining)
+                lhs_of.append(lhs)
+                remaining.append(len(rhs))
+                for symbol in rhs:
+                    occurrences.setdefault(symbol, []).append(index)
+                if not rhs and lhs not in nullable:
+                    nullable.add(lhs)
+                    queue.append(lhs)
+
+        while queue:
+            symbol = queue.popleft()
+            for index in occurrences.get(symbol, ()):
+                remaining[index] -= 1
+                if remaining[index] == 0 and lhs_of[index] not in nullable:
+                    nullable.add(lhs_of[index])
+                    queue.append(lhs_of[index])
+        return nullable
 
+    def binarize(self):
+        pairs = {}
         new_productions = {nt: [] for nt in self.p}
+        for lhs, rhs_list in list(self.p.items()):
+            for rhs in rhs_list:
+                new_productions[lhs].append(self._binarize_rhs(rhs, pairs, new_productions))
+        self.p = new_productions
+        return self
+
+    def _binarize_rhs(self, rhs, pairs, productions):
+        if len(rhs) <= 2:
+            return list(rhs)
+        tail = rhs[-1]
+        for i in range(len(rhs) - 2, 0, -1):
+            key = (rhs[i], tail)
+            pair_nt = pairs.get(key)
+            if pair_nt is None:
+                pair_nt = self.get_new_symbol()
+                self.vn.add(pair_nt)
+                pairs[key] = pair_nt
+                productions[pair_nt] = [[rhs[i], tail]]
+            tail = pair_nt
+        return [rhs[0], tail]
+
+    def remove_epsilon_productions(self, binarize=False, max_productions=None):
+        if binarize:
+            self.binarize()
+        nullable = self.nullable_symbols()
+
+        def over_budget(lhs, rhs):
+            return ValueError(
+                f"Epsilon removal exceeds the budget of {max_productions} productions "
+                f"while expanding {lhs} -> {''.join(rhs)}; retry with binarize=True "
+                f"or a larger max_productions"
+            )
+
+        new_productions = {nt: [] for nt in self.p}
+        total = 0
         for lhs, rhs_list in self.p.items():
+            seen = set()
             for rhs in rhs_list:
                 if not rhs:
                     continue
-                if rhs not in new_productions[lhs]:
-                    new_productions[lhs].append(rhs)
-                nullable_positions = [i for i, symbol in enumerate(rhs) if symbol in nullable]
-                for mask in range(1, 2 ** len(nullable_positions)):
-                    to_remove = []
-                    for i, pos in enumerate(nullable_positions):
-                        if (mask >> i) & 1:
-                            to_remove.append(pos)
-                    new_rhs = [symbol for i, symbol in enumerate(rhs) if i not in to_remove]
-                    if new_rhs and new_rhs not in new_productions[lhs]:
-                        new_productions[lhs].append(new_rhs)
+                variants = {(): None}
+                for symbol in rhs:
+                    expanded = dict.fromkeys(variant + (symbol,) for variant in variants)
+                    if symbol in nullable:
+                        expanded.update(variants)
+                    variants = expanded
+                    # Every partial variant extends to a distinct full one, so at
+                    # least this many of the final variants are not in seen yet.
+                    fresh = len(variants) - (() in variants) - len(seen)
+                    if max_productions is not None and total + fresh > max_productions:
+                        raise over_budget(lhs, rhs)
+                fresh = [key for key in variants if key and key not in seen]
+                if max_productions is not None and total + len(fresh) > max_productions:
+                    raise over_budget(lhs, rhs)
+                seen.update(fresh)
+                new_productions[lhs].extend(map(list, fresh))
+                total += len(fresh)
 
         self.p = new_productions
         return self
 
+    def unit_pair_bitsets(self):
+        nonterminals = sorted(self.vn)
+        index = {nt: i for i, nt in enumerate(nonterminals)}
+        graph = [[] for _ in nonterminals]
+        for lhs, rhs_list in self.p.items():
+            if lhs not in index:
+                continue
+            for rhs in rhs_list:
+                if len(rhs) == 1 and rhs[0] in index:
+                    graph[index[lhs]].append(index[rhs[0]])
+
+        reach = [0] * len(nonterminals)
+        order = [-1] * len(nonterminals)
+        lowlink = [0] * len(nonterminals)
+        on_stack = [False] * len(nonterminals)
+        stack = []
+        counter = 0
+        for root in range(len(nonterminals)):
+            if order[root] != -1:
+                continue
+            order[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            work = [(root, iter(graph[root]))]
+            while work:
+                node, successors = work[-1]
+                descended = False
+                for succ in successors:
+                    if order[succ] == -1:
+                        order[succ] = lowlink[succ] = counter
+                        counter += 1
+                        stack.append(succ)
+                        on_stack[succ] = True
+                        work.append((succ, iter(graph[succ])))
+                        descended = True
+                        break
+                    if on_stack[succ]:
+                        lowlink[node] = min(lowlink[node], order[succ])
+                if descended:
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == order[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component.append(member)
+                        if member == node:
+                            break
+                    bits = 0
+                    for member in component:
+                        bits |= 1 << member
+                    for member in component:
+                        for succ in graph[member]:
+                            bits |= reach[succ]
+                    for member in component:
+                        reach[member] = bits
+
+        return nonterminals, {nt: reach[i] for i, nt in enumerate(nonterminals)}
+
+    def unit_pairs(self):
+        nonterminals, reach = self.unit_pair_bitsets()
+        return {nt: {other for i, other in enumerate(nonterminals) if bits >> i & 1} for nt, bits in reach.items()}
+
     def remove_unit_productions(self):
-        unit_pairs = {}
-        for nt in self.vn:
-            unit_pairs[nt] = {nt}
-            changed = True
-            while changed:
-                changed = False
-                for lhs, rhs_list in self.p.items():
-                    if lhs == nt:
-                        for rhs in rhs_list:
-                            if len(rhs) == 1 and rhs[0] in self.vn and rhs[0] not in unit_pairs[nt]:
-                                unit_pairs[nt].add(rhs[0])
-                                changed = True
+        nonterminals, reach = self.unit_pair_bitsets()
 
         new_productions = {nt: [] for nt in self.p}
-        for lhs in self.vn:
-            for nt in unit_pairs[lhs]:
+        for lhs in nonterminals:
+            bits = reach[lhs]
+            seen = set()
+            while bits:
+                low = bits & -bits
+                nt = nonterminals[low.bit_length() - 1]
+                bits ^= low
                 for rhs in self.p.get(nt, []):
                     if len(rhs) != 1 or rhs[0] not in self.vn:
-                        if rhs not in new_productions[lhs]:
+                        key = tuple(rhs)
+                        if key not in seen:
+                            seen.add(key)
                             new_productions[lhs].append(rhs)
 
         self.p = new_productions
         return self
 
-    def remove_inaccessible_symbols(self):
-        accessible = {self.s}
-        changed = True
-        while changed:
-            changed = False
-            for lhs in list(accessible):
-                for rhs in self.p.get(lhs, []):
-                    for symbol in rhs:
-                        if symbol in self.vn and symbol not in accessible:
-                            accessible.add(symbol)
-                            changed = True
+    def _production_index(self):
+        productions = []
+        occurrences = {}
+        for lhs, rhs_list in self.p.items():
+            for rhs in rhs_list:
+                index = len(productions)
+                productions.append((lhs, rhs))
+                for symbol in rhs:
+                    occurrences.setdefault(symbol, []).append(index)
+        return productions, occurrences
 
-        for nt in list(self.vn):
-            if nt not in accessible:
-                self.vn.remove(nt)
-                if nt in self.p:
-                    del self.p[nt]
+    def productive_symbols(self):
+        productive, _ = self._productivity(*self._production_index())
+        return productive
 
-        for lhs in list(self.p.keys()):
-            if lhs not in self.vn:
-                del self.p[lhs]
-                continue
-            self.p[lhs] = [rhs for rhs in self.p[lhs] if all(symbol in self.vn or symbol in self.vt for symbol in rhs)]
+    def _productivity(self, productions, occurrences):
+        productive = set()
+        queue = deque()
+        remaining = []
+        for lhs, rhs in productions:
+            count = sum(1 for symbol in rhs if symbol not in self.vt)
+            remaining.append(count)
+            if count == 0 and lhs not in productive:
+                productive.add(lhs)
+                queue.append(lhs)
 
-        return self
+        while queue:
+            symbol = queue.popleft()
+            for position in occurrences.get(symbol, ()):
+                remaining[position] -= 1
+                if remaining[position] == 0:
+                    lhs = productions[position][0]
+                    if lhs not in productive:
+                        productive.add(lhs)
+                        queue.append(lhs)
+        return productive, remaining
 
-    def remove_non_productive_symbols(self):
-        productive = set()
-        changed = True
-        while changed:
-            changed = False
-            for lhs, rhs_list in self.p.items():
-                if lhs in productive:
+    def accessible_symbols(self, allowed=None):
+        return self._reachable(self.p, allowed)
+
+    def _reachable(self, rules, allowed=None):
+        accessible = {self.s}
+        queue = deque([self.s])
+        while queue:
+            lhs = queue.popleft()
+            for rhs in rules.get(lhs, []):
+                if allowed is not None and not all(symbol in allowed or symbol in self.vt for symbol in rhs):
                     continue
-                for rhs in rhs_list:
-                    if all(symbol in productive or symbol in self.vt for symbol in rhs):
-                        productive.add(lhs)
-                        changed = True
-                        break
+                for symbol in rhs:
+                    if symbol in self.vn and symbol not in accessible:
+                        accessible.add(symbol)
+                        queue.append(symbol)
+        return accessible
 
+    def _restrict(self, keep, allowed=None):
         for nt in list(self.vn):
-            if nt not in productive:
+            if nt not in keep:
                 self.vn.remove(nt)
                 if nt in self.p:
                     del self.p[nt]
 
+        if allowed is None:
+            allowed = self.vn
         for lhs in list(self.p.keys()):
             if lhs not in self.vn:
                 del self.p[lhs]
                 continue
-            self.p[lhs] = [rhs for rhs in self.p[lhs] if all(symbol in productive or symbol in self.vt for symbol in rhs)]
+            self.p[lhs] = [rhs for rhs in self.p[lhs] if all(symbol in allowed or symbol in self.vt for symbol in rhs)]
 
         return self
 
+    def remove_inaccessible_symbols(self):
+        return self._restrict(self.accessible_symbols())
+
+    def remove_non_productive_symbols(self):
+        productive = self.productive_symbols()
+        return self._restrict(productive, productive)
+
+    def reduce(self):
+        productions, occurrences = self._production_index()
+        productive, remaining = self._productivity(productions, occurrences)
+        rules = {}
+        for (lhs, rhs), count in zip(productions, remaining):
+            if count == 0:
+                rules.setdefault(lhs, []).append(rhs)
+        return self._restrict(productive & self._reachable(rules))
+
     def convert_to_cnf(self):
         terminal_productions = {}
         for t in self.vt:
@@ -138,28 +404,22 @@ class Grammar:
             self.p[new_nt] = [[t]]
             terminal_productions[t] = new_nt
 
+        pairs = {}
         new_productions = {nt: [] for nt in self.vn}
-        for lhs, rhs_list in self.p.items():
+        for lhs, rhs_list in list(self.p.items()):
             for rhs in rhs_list:
                 if len(rhs) == 1 and rhs[0] in self.vt:
                     new_productions[lhs].append(rhs)
                 elif len(rhs) >= 2:
-                    new_rhs = []
-                    for symbol in rhs:
-                        if symbol in self.vt:
-                            new_rhs.append(terminal_productions[symbol])
-                        else:
-                            new_rhs.append(symbol)
-                    while len(new_rhs) > 2:
-                        new_nt = self.get_new_symbol()
-                        self.vn.add(new_nt)
-                        new_productions[new_nt] = [[new_rhs[-2], new_rhs[-1]]]
-                        new_rhs = new_rhs[:-2] + [new_nt]
-                    new_productions[lhs].append(new_rhs)
+                    new_rhs = [terminal_productions.get(symbol, symbol) for symbol in rhs]
+                    new_productions[lhs].append(self._binarize_rhs(new_rhs, pairs, new_productions))
 
         self.p = new_productions
         return self
 
+    def production_count(self):
+        return sum(len(rhs_list) for rhs_list in self.p.values())
+
     def __str__(self):
         result = f"G = (VN, VT, P, {self.s})\n"
         result += f"VN = {self.vn}\n"
@@ -174,6 +434,91 @@ class Grammar:
         result += "}"
         return result
 
+NORMALIZATION_STAGES = [
+    ("remove_epsilon_productions", Grammar.remove_epsilon_productions),
+    ("remove_unit_productions", Grammar.remove_unit_productions),
+    ("remove_inaccessible_symbols", Grammar.remove_inaccessible_symbols),
+    ("remove_non_productive_symbols", Grammar.remove_non_productive_symbols),
+    ("convert_to_cnf", Grammar.convert_to_cnf),
+]
+
+def normalize(grammar, stages=None, profile=True, cache_dir=None):
+    available = dict(NORMALIZATION_STAGES, reduce=Grammar.reduce, binarize=Grammar.binarize)
+    if stages is None:
+        stages = [name for name, _ in NORMALIZATION_STAGES]
+
+    steps = []
+    cacheable = cache_dir is not None
+    for stage in stages:
+        if callable(stage):
+            cacheable = False
+            steps.append((getattr(stage, "__name__", repr(stage)), stage))
+        elif stage in available:
+            steps.append((stage, available[stage]))
+        else:
+            raise ValueError(f"Unknown normalization stage: {stage}")
+
+    path = cached = None
+    if cacheable:
+        key = hashlib.sha256(json.dumps([grammar.fingerprint(), [name for name, _ in steps]]).encode("utf-8"))
+        path = os.path.join(cache_dir, f"{key.hexdigest()}.grammar")
+        try:
+            cached = Grammar.load(path)
+        except (OSError, ValueError):
+            cached = None
+
+    if cached is not None:
+        def load_cache(target):
+            target.vn, target.vt, target.p, target.s = cached.vn, cached.vt, cached.p, cached.s
+            target.new_symbol_index = cached.new_symbol_index
+
+        steps = [("load_cache", load_cache)]
+
+    started_tracing = profile and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    report = []
+    try:
+        for name, step in steps:
+            if not profile:
+                step(grammar)
+                continue
+
+            productions_before = grammar.production_count()
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+            started = time.perf_counter()
+            step(grammar)
+            seconds = time.perf_counter() - started
+            memory_after, memory_peak = tracemalloc.get_traced_memory()
+            report.append({
+                "stage": name,
+                "seconds": seconds,
+                "memory_delta": memory_after - memory_before,
+                "memory_peak": memory_peak - memory_before,
+                "productions_before": productions_before,
+                "productions": grammar.production_count(),
+                "nonterminals": len(grammar.vn),
+            })
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+
+    if path is not None and cached is None:
+        os.makedirs(cache_dir, exist_ok=True)
+        grammar.save(path)
+    return grammar, report
+
+def format_report(report):
+    lines = [f"{'stage':<32}{'seconds':>10}{'memory Δ':>12}{'peak':>12}{'productions':>14}{'VN':>6}"]
+    for entry in report:
+        lines.append(
+            f"{entry['stage']:<32}{entry['seconds']:>10.4f}{entry['memory_delta']:>12}"
+            f"{entry['memory_peak']:>12}{entry['productions_before']:>6} -> {entry['productions']:<4}"
+            f"{entry['nonterminals']:>6}"
+        )
+    return "\n".join(lines)
+
 def main():
     vn = {'S', 'A', 'B', 'C', 'D'}
     vt = {'a', 'b'}
@@ -190,25 +535,22 @@ def main():
 
     print("Original Grammar:")
     print(grammar)
-    print("\nStep 1: After eliminating ε-productions")
-    grammar.remove_epsilon_productions()
-    print(grammar)
 
-    print("\nStep 2: After eliminating unit productions (renaming)")
-    grammar.remove_unit_productions()
-    print(grammar)
+    earley = EarleyRecognizer(grammar)
+    grammar, report = normalize(grammar)
 
-    print("\nStep 3: After eliminating inaccessible symbols")
-    grammar.remove_inaccessible_symbols()
-    print(grammar)
+    print("\nNormalization stages:")
+    print(format_report(report))
 
-    print("\nStep 4: After eliminating non-productive symbols")
-    grammar.remove_non_productive_symbols()
+    print("\nChomsky Normal Form:")
     print(grammar)
 
-    print("\nStep 5: Chomsky Normal Form")
-    grammar.convert_to_cnf()
-    print(grammar)
+    parser = CYKParser(grammar)
+    print("\nMembership (CYK on the CNF grammar, Earley on the original grammar):")
+    for word in ["abb", "abab", "ababab", "abba"]:
+        forest = parser.parse(word)
+        print(f"    {word}: CYK {forest.root is not None} ({forest.count_trees()} parse trees), "
+              f"Earley {earley.recognize(word)}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,383 @@
+import os
+import random
+import sys
+import tempfile
+import time
+import unittest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lfa_common.interned import UNKNOWN
+from main import GRAMMAR_HEADER, Grammar, normalize, format_report
+from cyk import CYKParser
+from earley import EarleyRecognizer
+
+
+def variant_grammar():
+    vn = {'S', 'A', 'B', 'C', 'D'}
+    vt = {'a', 'b'}
+    p = {
+        'S': [['a', 'b', 'A', 'B']],
+        'A': [['a', 'S', 'a', 'b'], ['B', 'S'], ['a', 'A'], ['b']],
+        'B': [['B', 'A'], ['a', 'b', 'a', 'b', 'B'], ['b'], []],
+        'C': [['A', 'S']],
+        'D': []
+    }
+    return Grammar(vn, vt, p, 'S')
+
+
+class TestEpsilonRemoval(unittest.TestCase):
+
+    def test_nullable_symbols(self):
+        self.assertEqual(variant_grammar().nullable_symbols(), {'B'})
+
+    def test_nullable_propagates_through_chains(self):
+        p = {'S': [['A', 'B', 'A']], 'A': [['C']], 'B': [['A', 'A'], ['b']], 'C': [[]], 'E': [['E', 'a']]}
+        grammar = Grammar({'S', 'A', 'B', 'C', 'E'}, {'a', 'b'}, p, 'S')
+        self.assertEqual(grammar.nullable_symbols(), {'S', 'A', 'B', 'C'})
+
+    def test_remove_epsilon_productions(self):
+        grammar = variant_grammar().remove_epsilon_productions()
+        self.assertEqual(grammar.p['B'], [['B', 'A'], ['A'], ['a', 'b', 'a', 'b', 'B'], ['a', 'b', 'a', 'b'], ['b']])
+        self.assertEqual(grammar.p['S'], [['a', 'b', 'A', 'B'], ['a', 'b', 'A']])
+        self.assertEqual(grammar.p['D'], [])
+
+    def wide_grammar(self, width):
+        nullable = [f'N{i}' for i in range(width)]
+        p = {'S': [nullable + ['a']]}
+        p.update({nt: [['b'], []] for nt in nullable})
+        return Grammar({'S'} | set(nullable), {'a', 'b'}, p, 'S')
+
+    def test_budget_exceeded(self):
+        with self.assertRaises(ValueError):
+            self.wide_grammar(12).remove_epsilon_productions(max_productions=500)
+        with self.assertRaises(ValueError):
+            self.wide_grammar(60).remove_epsilon_productions(max_productions=500)
+
+    def test_repeated_nullable_symbol(self):
+        p = {'S': [['N'] * 40 + ['a']], 'N': [['b'], []]}
+        grammar = Grammar({'S', 'N'}, {'a', 'b'}, p, 'S').remove_epsilon_productions(max_productions=100)
+        self.assertEqual(len(grammar.p['S']), 41)
+        self.assertEqual(grammar.p['S'][-1], ['a'])
+
+    def test_budget_counts_emitted_productions(self):
+        p = {'S': [['N', 'a'], ['a']], 'N': [[]]}
+        grammar = Grammar({'S', 'N'}, {'a'}, p, 'S').remove_epsilon_productions(max_productions=2)
+        self.assertEqual(grammar.p, {'S': [['N', 'a'], ['a']], 'N': []})
+        grammar = self.wide_grammar(3).remove_epsilon_productions(max_productions=11)
+        self.assertEqual(sum(len(rhs_list) for rhs_list in grammar.p.values()), 11)
+        with self.assertRaises(ValueError):
+            self.wide_grammar(3).remove_epsilon_productions(max_productions=10)
+
+    def test_binarized_expansion_stays_small(self):
+        grammar = self.wide_grammar(12).remove_epsilon_productions(binarize=True, max_productions=500)
+        self.assertLess(sum(len(rhs_list) for rhs_list in grammar.p.values()), 100)
+        self.assertTrue(all(len(rhs) <= 2 for rhs_list in grammar.p.values() for rhs in rhs_list))
+
+    def test_binarize_shares_tails(self):
+        p = {'S': [['a', 'A', 'B'], ['b', 'A', 'B']], 'A': [['a']], 'B': [['b']]}
+        grammar = Grammar({'S', 'A', 'B'}, {'a', 'b'}, p, 'S').binarize()
+        self.assertEqual(grammar.p['S'][0][1], grammar.p['S'][1][1])
+        self.assertEqual(len(grammar.vn), 4)
+
+
+class TestUnitProductions(unittest.TestCase):
+
+    def chain_grammar(self):
+        p = {'S': [['A'], ['a', 'S']], 'A': [['B'], ['a']], 'B': [['A'], ['C'], ['b', 'b']], 'C': [['c']]}
+        return Grammar({'S', 'A', 'B', 'C'}, {'a', 'b', 'c'}, p, 'S')
+
+    def test_unit_pairs_are_transitive(self):
+        pairs = self.chain_grammar().unit_pairs()
+        self.assertEqual(pairs['S'], {'S', 'A', 'B', 'C'})
+        self.assertEqual(pairs['A'], {'A', 'B', 'C'})
+        self.assertEqual(pairs['B'], {'A', 'B', 'C'})
+        self.assertEqual(pairs['C'], {'C'})
+
+    def test_remove_unit_productions(self):
+        grammar = self.chain_grammar().remove_unit_productions()
+        self.assertEqual(sorted(grammar.p['S']), [['a'], ['a', 'S'], ['b', 'b'], ['c']])
+        self.assertEqual(sorted(grammar.p['B']), [['a'], ['b', 'b'], ['c']])
+        self.assertEqual(grammar.p['C'], [['c']])
+
+
+class TestReduction(unittest.TestCase):
+
+    def useless_grammar(self):
+        p = {
+            'S': [['a', 'A'], ['B']],
+            'A': [['a']],
+            'B': [['b', 'B']],
+            'C': [['c']],
+            'D': [['A', 'E']],
+            'E': [['D']],
+        }
+        return Grammar({'S', 'A', 'B', 'C', 'D', 'E'}, {'a', 'b', 'c'}, p, 'S')
+
+    def test_productive_and_accessible(self):
+        grammar = self.useless_grammar()
+        self.assertEqual(grammar.productive_symbols(), {'S', 'A', 'C'})
+        self.assertEqual(grammar.accessible_symbols(), {'S', 'A', 'B'})
+
+    def test_reduce(self):
+        grammar = self.useless_grammar().reduce()
+        self.assertEqual(grammar.vn, {'S', 'A'})
+        self.assertEqual(grammar.p, {'S': [['a', 'A']], 'A': [['a']]})
+
+    def test_reduce_matches_separate_steps(self):
+        separate = self.useless_grammar().remove_non_productive_symbols().remove_inaccessible_symbols()
+        combined = self.useless_grammar().reduce()
+        self.assertEqual(separate.p, combined.p)
+        self.assertEqual(separate.vn, combined.vn)
+
+
+class TestChomskyNormalForm(unittest.TestCase):
+
+    def test_shared_binarization(self):
+        p = {'S': [['A', 'B', 'C', 'D'], ['B', 'C', 'D']], 'A': [['a']], 'B': [['b']], 'C': [['c']], 'D': [['d']]}
+        grammar = Grammar({'S', 'A', 'B', 'C', 'D'}, {'a', 'b', 'c', 'd'}, p, 'S').convert_to_cnf()
+        first, second = grammar.p['S']
+        self.assertEqual(grammar.p[first[1]], [second])
+        self.assertEqual(len(grammar.vn), 5 + 4 + 2)
+
+    def test_cnf_shape(self):
+        grammar = variant_grammar()
+        grammar.remove_epsilon_productions().remove_unit_productions().reduce().convert_to_cnf()
+        for lhs, rhs_list in grammar.p.items():
+            for rhs in rhs_list:
+                if len(rhs) == 1:
+                    self.assertIn(rhs[0], grammar.vt)
+                else:
+                    self.assertEqual(len(rhs), 2)
+                    self.assertTrue(all(symbol in grammar.vn for symbol in rhs))
+
+
+class TestNormalize(unittest.TestCase):
+
+    def test_default_pipeline(self):
+        expected = variant_grammar()
+        expected.remove_epsilon_productions().remove_unit_productions()
+        expected.remove_inaccessible_symbols().remove_non_productive_symbols().convert_to_cnf()
+
+        grammar, report = normalize(variant_grammar())
+        self.assertEqual(grammar.production_count(), expected.production_count())
+        self.assertEqual([entry["stage"] for entry in report], [
+            "remove_epsilon_productions", "remove_unit_productions", "remove_inaccessible_symbols",
+            "remove_non_productive_symbols", "convert_to_cnf",
+        ])
+        self.assertEqual(report[0]["productions_before"], 10)
+        self.assertEqual(report[-1]["productions"], grammar.production_count())
+        self.assertTrue(all(entry["seconds"] >= 0 for entry in report))
+        self.assertIn("convert_to_cnf", format_report(report))
+
+    def test_custom_stages_without_profile(self):
+        grammar, report = normalize(variant_grammar(), stages=["remove_epsilon_productions", "reduce"], profile=False)
+        self.assertEqual(report, [])
+        self.assertNotIn('C', grammar.vn)
+        with self.assertRaises(ValueError):
+            normalize(variant_grammar(), stages=["unknown"])
+
+    def test_cache_round_trip(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            built, _ = normalize(variant_grammar(), profile=False, cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            loaded, report = normalize(variant_grammar(), cache_dir=cache_dir)
+            self.assertEqual([entry["stage"] for entry in report], ["load_cache"])
+            self.assertEqual((loaded.vn, loaded.vt, loaded.s), (built.vn, built.vt, built.s))
+            self.assertEqual({lhs: sorted(rhs) for lhs, rhs in loaded.p.items()},
+                             {lhs: sorted(rhs) for lhs, rhs in built.p.items()})
+            self.assertEqual(loaded.get_new_symbol(), built.get_new_symbol())
+
+            normalize(variant_grammar(), stages=["reduce"], profile=False, cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    def test_corrupt_cache_is_a_miss(self):
+        expected, _ = normalize(variant_grammar(), profile=False)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            normalize(variant_grammar(), profile=False, cache_dir=cache_dir)
+            path = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+            with open(path, "rb") as f:
+                data = bytearray(f.read())
+            _, _, itemsize, _, _, blob_size, _ = GRAMMAR_HEADER.unpack_from(data)
+            offset = GRAMMAR_HEADER.size + blob_size
+            for position, value in [(offset + itemsize, 1 << 20), (offset + 3 * itemsize, 1 << 20)]:
+                corrupt = bytearray(data)
+                corrupt[position:position + 4] = value.to_bytes(4, sys.byteorder)
+                with open(path, "wb") as f:
+                    f.write(corrupt)
+                with self.assertRaises(ValueError):
+                    Grammar.load(path)
+                loaded, _ = normalize(variant_grammar(), profile=False, cache_dir=cache_dir)
+                self.assertEqual((loaded.vn, loaded.p), (expected.vn, expected.p))
+
+    def test_cache_keeps_pruned_start_symbol(self):
+        grammar = Grammar({'S', 'A'}, {'a'}, {'S': [['S', 'a']], 'A': [['a']]}, 'S')
+        with tempfile.TemporaryDirectory() as cache_dir:
+            built, _ = normalize(grammar, profile=False, cache_dir=cache_dir)
+            loaded, _ = normalize(Grammar({'S', 'A'}, {'a'}, {'S': [['S', 'a']], 'A': [['a']]}, 'S'),
+                                  profile=False, cache_dir=cache_dir)
+        self.assertNotIn('S', built.vn)
+        self.assertEqual((loaded.vn, loaded.vt, loaded.s, loaded.p), (built.vn, built.vt, built.s, built.p))
+
+    def test_cache_key_includes_new_symbol_index(self):
+        uncached = variant_grammar()
+        uncached.new_symbol_index = 5
+        expected, _ = normalize(uncached, profile=False)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            normalize(variant_grammar(), profile=False, cache_dir=cache_dir)
+            for _ in range(2):
+                grammar = variant_grammar()
+                grammar.new_symbol_index = 5
+                loaded, _ = normalize(grammar, profile=False, cache_dir=cache_dir)
+                self.assertEqual((loaded.vn, loaded.p), (expected.vn, expected.p))
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    def test_cache_skips_callable_stages(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            normalize(variant_grammar(), stages=[lambda g: g.remove_epsilon_productions()], cache_dir=cache_dir)
+            grammar, _ = normalize(variant_grammar(), stages=[lambda g: g.convert_to_cnf()], cache_dir=cache_dir)
+            self.assertEqual(os.listdir(cache_dir), [])
+            self.assertTrue(all(len(rhs) <= 2 for rhs_list in grammar.p.values() for rhs in rhs_list))
+
+
+class TestCYK(unittest.TestCase):
+
+    def test_recognize_normalized_grammar(self):
+        grammar, _ = normalize(variant_grammar(), profile=False)
+        parser = CYKParser(grammar)
+        self.assertTrue(parser.recognize("abb"))
+        self.assertTrue(parser.recognize("ababab"))
+        self.assertFalse(parser.recognize("abba"))
+        self.assertFalse(parser.recognize(""))
+        self.assertFalse(parser.recognize("abc"))
+
+    def test_shared_forest_counts_ambiguity(self):
+        grammar = Grammar({'S'}, {'a'}, {'S': [['S', 'S'], ['a']]}, 'S')
+        forest = CYKParser(grammar).parse("a" * 8)
+        self.assertEqual(forest.count_trees(), 429)
+        self.assertEqual(len(forest.nodes), 8 * 9 // 2)
+        self.assertEqual(forest.tree(("S", 0, 1)), ("S", "a"))
+
+    def test_tree_on_long_input(self):
+        grammar = Grammar({'S', 'A'}, {'a'}, {'S': [['S', 'A'], ['a']], 'A': [['a']]}, 'S')
+        forest = CYKParser(grammar).parse("a" * 1200)
+        self.assertEqual(forest.count_trees(), 1)
+        tree = forest.tree()
+        depth = 0
+        while len(tree) == 3:
+            self.assertEqual(tree[2], ("A", "a"))
+            tree = tree[1]
+            depth += 1
+        self.assertEqual((depth, tree), (1199, ("S", "a")))
+
+    def test_rejects_non_cnf(self):
+        with self.assertRaises(ValueError):
+            CYKParser(variant_grammar())
+
+    def random_grammar(self, seed=1, count=50, rules=460):
+        rng = random.Random(seed)
+        names = [f"N{i}" for i in range(count)]
+        productions = {name: [] for name in names}
+        pairs = set()
+        while len(pairs) < rules:
+            pairs.add((rng.choice(names), rng.choice(names), rng.choice(names)))
+        for lhs, left, right in sorted(pairs):
+            productions[lhs].append([left, right])
+        for name in names:
+            if rng.random() < 0.3:
+                productions[name].append([rng.choice("ab")])
+        return Grammar(set(names), {'a', 'b'}, productions, "N0")
+
+    def test_matches_earley_on_random_grammar(self):
+        grammar = self.random_grammar(seed=2, count=8, rules=30)
+        parser, earley = CYKParser(grammar), EarleyRecognizer(grammar)
+        rng = random.Random(2)
+        for length in [1, 2, 3, 5, 8, 13, 21, 34]:
+            for _ in range(5):
+                word = "".join(rng.choice("ab") for _ in range(length))
+                self.assertEqual(parser.recognize(word), earley.recognize(word), word)
+                self.assertEqual(parser.parse(word).root is not None, earley.recognize(word), word)
+
+    def test_long_input_on_large_grammar(self):
+        parser = CYKParser(self.random_grammar())
+        self.assertEqual(sum(len(pairs) for pairs in parser.rules_by_lhs.values()), 460)
+        tokens = [random.Random(1000).choice("ab") for _ in range(1000)]
+        started = time.perf_counter()
+        self.assertTrue(parser.recognize(tokens))
+        self.assertLess(time.perf_counter() - started, 20)
+
+
+class TestEarley(unittest.TestCase):
+
+    def test_matches_cyk_on_original_grammar(self):
+        earley = EarleyRecognizer(variant_grammar())
+        cyk = CYKParser(normalize(variant_grammar(), profile=False)[0])
+        for word in ["abb", "abab", "ababab", "abba", "ab", "abbab", "ababbbab"]:
+            self.assertEqual(earley.recognize(word), cyk.recognize(word), word)
+
+    def test_nullable_and_empty_input(self):
+        grammar = Grammar({'S', 'A'}, {'a'}, {'S': [['A', 'A', 'a'], []], 'A': [[]]}, 'S')
+        earley = EarleyRecognizer(grammar)
+        self.assertTrue(earley.recognize(""))
+        self.assertTrue(earley.recognize("a"))
+        self.assertFalse(earley.recognize("aa"))
+
+    def test_incremental_feeding(self):
+        grammar = Grammar({'S'}, {'a', 'b'}, {'S': [['a', 'S', 'b'], ['a', 'b']]}, 'S')
+        earley = EarleyRecognizer(grammar)
+        self.assertTrue(earley.feed_many("aab"))
+        self.assertFalse(earley.accepts())
+        earley.feed("b")
+        self.assertTrue(earley.accepts())
+        self.assertFalse(earley.feed("b"))
+        self.assertEqual(earley.position, 5)
+
+    def test_leo_chain_through_start_symbol(self):
+        p = {
+            'S': [['b', 'A', 'b', 'B'], ['C', 'A'], ['A', 'S']],
+            'A': [['a', 'a'], ['a']],
+            'B': [['C'], ['A']],
+            'C': [['S'], ['C', 'a', 'S'], ['a', 'B', 'A', 'A']],
+        }
+        earley = EarleyRecognizer(Grammar(set(p), {'a', 'b'}, p, 'S'))
+        self.assertTrue(earley.recognize("baba"))
+        self.assertFalse(earley.recognize("bab"))
+
+    def test_right_recursion_stays_linear(self):
+        grammar = Grammar({'S'}, {'a'}, {'S': [['a', 'S'], ['a']]}, 'S')
+        earley = EarleyRecognizer(grammar)
+        self.assertTrue(earley.recognize("a" * 2000))
+        self.assertLess(max(len(earley_set.items) for earley_set in earley.sets), 10)
+
+
+class TestInternedGrammar(unittest.TestCase):
+
+    def test_round_trip(self):
+        grammar = variant_grammar()
+        restored = Grammar.from_interned(grammar.to_interned())
+        self.assertEqual(restored.p, grammar.p)
+        self.assertEqual(restored.vn, grammar.vn)
+        self.assertEqual(restored.vt, grammar.vt)
+        self.assertEqual(restored.s, grammar.s)
+
+    def test_deduplicates_productions(self):
+        grammar = variant_grammar()
+        grammar.p['A'].append(['b'])
+        interned = grammar.to_interned()
+        self.assertEqual(len(interned), 10)
+        lhs = interned.symbols.ids['A']
+        self.assertFalse(interned.add(lhs, interned.symbols.tokenize(['a', 'A'])))
+        self.assertTrue(interned.add(lhs, interned.symbols.tokenize(['A', 'a'])))
+
+    def test_undeclared_symbols_stay_unknown(self):
+        grammar = Grammar({'S'}, {'a'}, {'S': [['a', 'c']]}, 'S')
+        interned = grammar.to_interned()
+        self.assertEqual(interned.symbols.kinds[interned.symbols.ids['c']], UNKNOWN)
+        restored = Grammar.from_interned(interned)
+        self.assertEqual((restored.vt, restored.p), ({'a'}, grammar.p))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "test.grammar")
+            grammar.save(path)
+            self.assertEqual(Grammar.load(path).vt, {'a'})
+
+
+if __name__ == '__main__':
+    unittest.main()
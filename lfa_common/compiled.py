@@ -0,0 +1,356 @@
+# Matching engine shared by lab1 and lab2: a compiled array-backed DFA, its
+# .dfa file format, the process-pool worker helpers and the streaming matcher.
+import codecs
+import itertools
+import json
+import mmap
+import os
+import multiprocessing
+import struct
+import sys
+import time
+from array import array
+from collections import deque
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_worker_automaton = None
+
+
+def _init_match_worker(compiled):
+    global _worker_automaton
+    _worker_automaton = compiled
+
+
+def _match_chunk(chunk):
+    return _worker_automaton.match_many(chunk)
+
+
+def _iter_chunks(strings, chunksize):
+    iterator = iter(strings)
+    while True:
+        chunk = list(itertools.islice(iterator, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parallel_match(compiled, strings, workers=None, chunksize=1024, stats=None):
+    workers = workers or os.cpu_count() or 1
+    if stats is None:
+        stats = {}
+    stats.update(workers=workers, strings=0, chunks=0, seconds=0.0, strings_per_second=0.0)
+    started = time.perf_counter()
+
+    with multiprocessing.Pool(workers, _init_match_worker, (compiled,)) as pool:
+        pending = deque()
+        for chunk in _iter_chunks(strings, chunksize):
+            pending.append(pool.apply_async(_match_chunk, (chunk,)))
+            if len(pending) >= workers * 2:
+                yield from _collect_chunk(pending.popleft(), stats, started)
+        while pending:
+            yield from _collect_chunk(pending.popleft(), stats, started)
+
+
+def _collect_chunk(result, stats, started):
+    results = result.get()
+    stats["chunks"] += 1
+    stats["strings"] += len(results)
+    stats["seconds"] = time.perf_counter() - started
+    if stats["seconds"] > 0:
+        stats["strings_per_second"] = stats["strings"] / stats["seconds"]
+    return results
+
+
+_AUTOMATON_MAGIC = b"LFA1"
+_AUTOMATON_HEADER = struct.Struct("<4sBBxxIIII")
+
+
+class CompiledAutomaton:
+    def __init__(self, states, alphabet, transitions, start_state, final_states):
+        symbols = set(alphabet)
+        compiled_states = [None, start_state]
+        state_ids = {start_state: 1}
+        for (state, symbol), next_state in transitions.items():
+            symbols.add(symbol)
+            for s in (state, next_state):
+                if s not in state_ids:
+                    state_ids[s] = len(compiled_states)
+                    compiled_states.append(s)
+        for s in list(states) + list(final_states):
+            if s not in state_ids:
+                state_ids[s] = len(compiled_states)
+                compiled_states.append(s)
+
+        self.symbol_ids = {symbol: i for i, symbol in enumerate(sorted(symbols))}
+        self.width = max(len(self.symbol_ids), 1)
+        self.states = compiled_states
+        self.table = array('i', [0]) * (len(compiled_states) * self.width)
+        for (state, symbol), next_state in transitions.items():
+            offset = state_ids[state] * self.width + self.symbol_ids[symbol]
+            self.table[offset] = state_ids[next_state] * self.width
+        self.start = state_ids[start_state] * self.width
+        self.accepting = bytearray(len(compiled_states))
+        for s in final_states:
+            self.accepting[state_ids[s]] = 1
+        self.unknown_code = self.width
+        self.pad_code = self.width + 1
+        self._dense = None
+
+    def save(self, path):
+        symbols = sorted(self.symbol_ids, key=self.symbol_ids.get)
+        blob = json.dumps(symbols).encode("utf-8")
+        blob += b"\0" * (-(_AUTOMATON_HEADER.size + len(blob)) % self.table.itemsize)
+        header = _AUTOMATON_HEADER.pack(
+            _AUTOMATON_MAGIC, sys.byteorder == "big", self.table.itemsize,
+            len(self.states), self.width, self.start, len(blob)
+        )
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(header)
+            f.write(blob)
+            f.write(bytes(self.table))
+            f.write(bytes(self.accepting))
+        os.replace(temporary, path)
+
+    @classmethod
+    def load_or_build(cls, path, build, compiled=None):
+        if compiled is None:
+            try:
+                return cls.load(path)
+            except (OSError, ValueError):
+                compiled = build()
+        elif os.path.exists(path):
+            return compiled
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        compiled.save(path)
+        return compiled
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mapped) < _AUTOMATON_HEADER.size:
+            raise ValueError(f"{path} is not a compiled automaton")
+        magic, big_endian, itemsize, count, width, start, blob_size = _AUTOMATON_HEADER.unpack_from(mapped)
+        table_size = count * width * itemsize
+        offset = _AUTOMATON_HEADER.size + blob_size
+        if magic != _AUTOMATON_MAGIC or len(mapped) != offset + table_size + count:
+            raise ValueError(f"{path} is not a compiled automaton")
+
+        view = memoryview(mapped)
+        table = view[offset:offset + table_size]
+        if big_endian == (sys.byteorder == "big") and itemsize == array('i').itemsize:
+            table = table.cast('i')
+        elif itemsize in (4, 8):
+            code = "i" if itemsize == 4 else "q"
+            table = array('i', struct.unpack(f"{'>' if big_endian else '<'}{count * width}{code}", table))
+        else:
+            raise ValueError(f"{path} uses an unsupported table item size {itemsize}")
+
+        self = cls.__new__(cls)
+        symbols = json.loads(bytes(view[_AUTOMATON_HEADER.size:offset]).rstrip(b"\0"))
+        self.symbol_ids = {symbol: i for i, symbol in enumerate(symbols)}
+        self.width = width
+        self.states = range(count)
+        self.table = table
+        self.start = start
+        self.accepting = view[offset + table_size:]
+        self.unknown_code = width
+        self.pad_code = width + 1
+        self._dense = None
+        return self
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        if isinstance(self.table, memoryview):
+            state["table"] = array('i', self.table)
+            state["accepting"] = bytearray(self.accepting)
+        return state
+
+    def matches(self, input_string):
+        table = self.table
+        symbol_ids = self.symbol_ids
+        state = self.start
+        for char in input_string:
+            column = symbol_ids.get(char)
+            if column is None:
+                return False
+            state = table[state + column]
+            if not state:
+                return False
+        return self.accepting[state // self.width] == 1
+
+    def match_many(self, strings):
+        table = self.table
+        symbol_ids = self.symbol_ids
+        accepting = self.accepting
+        width = self.width
+        start = self.start
+        results = []
+        for input_string in strings:
+            state = start
+            for char in input_string:
+                column = symbol_ids.get(char)
+                if column is None:
+                    state = 0
+                    break
+                state = table[state + column]
+                if not state:
+                    break
+            results.append(accepting[state // width] == 1)
+        return results
+
+    def dense_matrix(self):
+        if self._dense is None:
+            width = self.width
+            rows = []
+            for i in range(len(self.states)):
+                row = [offset // width for offset in self.table[i * width:(i + 1) * width]]
+                row.append(0)
+                row.append(i)
+                rows.append(row)
+            self._dense = np.array(rows, dtype=np.int32) if np is not None else rows
+        return self._dense
+
+    def encode_batch(self, strings, padded=True):
+        symbol_ids = self.symbol_ids
+        unknown = self.unknown_code
+        encoded = [[symbol_ids.get(char, unknown) for char in s] for s in strings]
+        if padded:
+            max_length = max((len(codes) for codes in encoded), default=0)
+            rows = [codes + [self.pad_code] * (max_length - len(codes)) for codes in encoded]
+            if np is not None:
+                return np.array(rows, dtype=np.int32).reshape(len(rows), max_length)
+            return rows
+        offsets = [0]
+        flat = []
+        for codes in encoded:
+            flat.extend(codes)
+            offsets.append(len(flat))
+        if np is not None:
+            return np.array(flat, dtype=np.int32), np.array(offsets, dtype=np.int64)
+        return flat, offsets
+
+    def match_batch(self, codes, offsets=None):
+        if np is None:
+            return self._match_batch_python(codes, offsets)
+        matrix = self.dense_matrix()
+        accepting = np.frombuffer(bytes(self.accepting), dtype=np.uint8).astype(bool)
+        start = self.start // self.width
+        codes = np.asarray(codes)
+
+        if offsets is None:
+            state = np.full(codes.shape[0], start, dtype=np.int32)
+            for j in range(codes.shape[1]):
+                state = matrix[state, codes[:, j]]
+            return accepting[state]
+
+        offsets = np.asarray(offsets)
+        lengths = np.diff(offsets)
+        order = np.argsort(-lengths, kind="stable")
+        sorted_lengths = lengths[order]
+        sorted_starts = offsets[:-1][order]
+        state = np.full(len(lengths), start, dtype=np.int32)
+        max_length = int(sorted_lengths[0]) if len(lengths) else 0
+        for j in range(max_length):
+            active = int(np.count_nonzero(sorted_lengths > j))
+            state[:active] = matrix[state[:active], codes[sorted_starts[:active] + j]]
+        result = np.empty(len(lengths), dtype=bool)
+        result[order] = accepting[state]
+        return result
+
+    def _match_batch_python(self, codes, offsets=None):
+        matrix = self.dense_matrix()
+        start = self.start // self.width
+        if offsets is not None:
+            codes = [codes[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+        results = []
+        for row in codes:
+            state = start
+            for code in row:
+                state = matrix[state][code]
+            results.append(self.accepting[state] == 1)
+        return results
+
+
+class StreamMatcher:
+    def __init__(self, compiled, encoding="utf-8"):
+        self.compiled = compiled
+        self.encoding = encoding
+        self.reset()
+
+    def reset(self):
+        self.state = self.compiled.start
+        self._decoder = codecs.getincrementaldecoder(self.encoding)()
+
+    def feed(self, chunk):
+        if not isinstance(chunk, str):
+            chunk = self._decoder.decode(chunk)
+        state = self.state
+        if not state:
+            return
+        table = self.compiled.table
+        symbol_ids = self.compiled.symbol_ids
+        for char in chunk:
+            column = symbol_ids.get(char)
+            if column is None:
+                state = 0
+                break
+            state = table[state + column]
+            if not state:
+                break
+        self.state = state
+
+    def accepts(self):
+        return self.compiled.accepting[self.state // self.compiled.width] == 1
+
+    def match_records(self, source, delimiter="\n", chunk_size=1 << 16, use_mmap=False):
+        opened = isinstance(source, (str, os.PathLike))
+        f = open(source, "rb") if opened else source
+        mapped = None
+        try:
+            if use_mmap:
+                size = os.fstat(f.fileno()).st_size
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+                chunks = (mapped[i:i + chunk_size] for i in range(0, size, chunk_size))
+            else:
+                chunks = iter(lambda: f.read(chunk_size), "")
+
+            decoder = codecs.getincrementaldecoder(self.encoding)()
+            keep = len(delimiter) - 1
+            carry = ""
+            has_data = False
+            self.reset()
+            for chunk in chunks:
+                if not chunk:
+                    break
+                if not isinstance(chunk, str):
+                    chunk = decoder.decode(chunk)
+                parts = (carry + chunk).split(delimiter)
+                for part in parts[:-1]:
+                    self.feed(part)
+                    yield self.accepts()
+                    self.reset()
+                    has_data = False
+                tail = parts[-1]
+                carry = tail[len(tail) - keep:] if keep and tail else ""
+                if len(tail) > len(carry):
+                    self.feed(tail[:len(tail) - len(carry)])
+                    has_data = True
+
+            tail = carry + decoder.decode(b"", final=True)
+            if tail:
+                self.feed(tail)
+                has_data = True
+            if has_data:
+                yield self.accepts()
+            self.reset()
+        finally:
+            if mapped is not None:
+                mapped.close()
+            if opened:
+                f.close()
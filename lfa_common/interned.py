@@ -0,0 +1,61 @@
+# Interned grammar representation shared by lab2 and lab5. Each lab picks its
+# own production keys: lab2 keys productions by token tuples because its
+# left-hand sides are strings of symbols, lab5 by the single non-terminal id.
+TERMINAL = 0
+NONTERMINAL = 1
+UNKNOWN = 2
+
+
+class SymbolTable:
+    def __init__(self):
+        self.ids = {}
+        self.symbols = []
+        self.kinds = bytearray()
+        self._lengths = []
+
+    def intern(self, symbol, kind=UNKNOWN):
+        symbol_id = self.ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+            self.kinds.append(kind)
+            if isinstance(symbol, str) and symbol and len(symbol) not in self._lengths:
+                self._lengths = sorted(self._lengths + [len(symbol)], reverse=True)
+        elif kind != UNKNOWN:
+            self.kinds[symbol_id] = kind
+        return symbol_id
+
+    def tokenize(self, text):
+        if not isinstance(text, str):
+            return tuple(self.intern(symbol) for symbol in text)
+
+        tokens = []
+        i = 0
+        while i < len(text):
+            for length in self._lengths:
+                symbol_id = self.ids.get(text[i:i + length])
+                if symbol_id is not None:
+                    break
+            else:
+                length = 1
+                symbol_id = self.intern(text[i])
+            tokens.append(symbol_id)
+            i += length
+        return tuple(tokens)
+
+
+class InternedGrammar:
+    def __init__(self, symbols, start=None):
+        self.symbols = symbols
+        self.start = start
+        self.productions = {}
+
+    def add(self, lhs, rhs):
+        rhs_set = self.productions.setdefault(lhs, {})
+        if rhs in rhs_set:
+            return False
+        rhs_set[rhs] = None
+        return True
+
+    def __len__(self):
+        return sum(len(rhs_set) for rhs_set in self.productions.values())
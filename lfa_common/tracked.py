@@ -0,0 +1,206 @@
+# Containers that count in-place edits so that cached tables can be checked
+# in O(1), shared by lab1 and lab2. Versions come from one counter and never
+# repeat, and a container rebuilds from plain data when unpickled. Subclasses
+# can override _element() to convert the items stored in a list value, and
+# _extended() to follow appends without a full rebuild.
+import itertools
+
+_versions = itertools.count(1)
+
+
+class TrackedList(list):
+    def __init__(self, values, owner, key):
+        super().__init__(map(owner._element, values))
+        self._owner = owner
+        self._key = key
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+    def _changed(self):
+        self._owner._changed(self._key)
+
+    def __setitem__(self, position, value):
+        if isinstance(position, slice):
+            value = [self._owner._element(item) for item in value]
+        else:
+            value = self._owner._element(value)
+        super().__setitem__(position, value)
+        self._changed()
+
+    def __delitem__(self, position):
+        super().__delitem__(position)
+        self._changed()
+
+    def __iadd__(self, other):
+        other = [self._owner._element(item) for item in other]
+        super().__iadd__(other)
+        self._owner._extended(self._key, other)
+        return self
+
+    def __imul__(self, count):
+        super().__imul__(count)
+        self._changed()
+        return self
+
+    def append(self, value):
+        value = self._owner._element(value)
+        super().append(value)
+        self._owner._extended(self._key, (value,))
+
+    def extend(self, values):
+        values = [self._owner._element(item) for item in values]
+        super().extend(values)
+        self._owner._extended(self._key, values)
+
+    def insert(self, position, value):
+        super().insert(position, self._owner._element(value))
+        self._changed()
+
+    def remove(self, value):
+        super().remove(value)
+        self._changed()
+
+    def pop(self, *args):
+        value = super().pop(*args)
+        self._changed()
+        return value
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._changed()
+
+    def reverse(self):
+        super().reverse()
+        self._changed()
+
+
+class TrackedDict(dict):
+    def __init__(self, items=()):
+        super().__init__()
+        self.version = next(_versions)
+        self.update(items)
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+    def _changed(self, key=None):
+        self.version = next(_versions)
+
+    def _extended(self, key, values):
+        self._changed(key)
+
+    def _element(self, value):
+        return value
+
+    def __setitem__(self, key, value):
+        if isinstance(value, list):
+            value = TrackedList(value, self, key)
+        super().__setitem__(key, value)
+        self._changed(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed(key)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key not in self:
+            return super().pop(key, *default)
+        value = super().pop(key)
+        self._changed(key)
+        return value
+
+    def popitem(self):
+        key, value = super().popitem()
+        self._changed(key)
+        return key, value
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+
+class TrackedSet(set):
+    def __init__(self, items=()):
+        super().__init__(items)
+        self.version = next(_versions)
+
+    def __reduce__(self):
+        return type(self), (set(self),)
+
+    def _changed(self):
+        self.version = next(_versions)
+
+    def __ior__(self, other):
+        super().__ior__(other)
+        self._changed()
+        return self
+
+    def __iand__(self, other):
+        super().__iand__(other)
+        self._changed()
+        return self
+
+    def __isub__(self, other):
+        super().__isub__(other)
+        self._changed()
+        return self
+
+    def __ixor__(self, other):
+        super().__ixor__(other)
+        self._changed()
+        return self
+
+    def add(self, element):
+        super().add(element)
+        self._changed()
+
+    def discard(self, element):
+        super().discard(element)
+        self._changed()
+
+    def remove(self, element):
+        super().remove(element)
+        self._changed()
+
+    def pop(self):
+        element = super().pop()
+        self._changed()
+        return element
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+    def update(self, *others):
+        super().update(*others)
+        self._changed()
+
+    def intersection_update(self, *others):
+        super().intersection_update(*others)
+        self._changed()
+
+    def difference_update(self, *others):
+        super().difference_update(*others)
+        self._changed()
+
+    def symmetric_difference_update(self, other):
+        super().symmetric_difference_update(other)
+        self._changed()